@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache "
+    "(key TEXT PRIMARY KEY, data TEXT, size INTEGER, stored_at REAL, last_used INTEGER)"
+)
+
+# Seconds a cached response is used for, by client method
+DEFAULT_TTLS = {
+    'get_supplier': 24 * 60 * 60,
+    'get_supplier_framework_info': 60 * 60,
+    'get_interested_suppliers': 60 * 60,
+    'find_draft_services': 60 * 60,
+    'find_draft_services_iter': 60 * 60,
+}
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+READ_METHOD_PREFIXES = ('get_', 'find_')
+
+
+class CachingDataAPIClient(object):
+    """Wrap a DataAPIClient so that responses from slow, repeated reads are cached on disk
+
+    Calls to the methods in `ttls` are answered from `cache_file` if the same call was
+    made less than that many seconds ago. Other `get_` and `find_` methods go straight
+    to the API. The least recently used responses are removed once the cached data is
+    larger than `max_size` bytes. Hits and misses for each method are counted in `hits`
+    and `misses`.
+
+    Responses are cached against the wrapped client's `base_url` as well as the call,
+    so a cache file used against more than one stage never answers for the wrong one.
+
+    Any other method is refused unless `allow_writes` is set, so a script can't
+    update the API based on cached data by accident.
+
+    """
+    def __init__(self, client, cache_file, ttls=None, max_size=DEFAULT_MAX_SIZE, allow_writes=False,
+                 clock=time.time):
+        self._client = client
+        # Snapshot clients have no base_url
+        self._base_url = getattr(client, 'base_url', None)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_size = max_size
+        self.allow_writes = allow_writes
+        self._clock = clock
+
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+
+        # Pipelines call the client from several threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self._connection.execute(SCHEMA)
+        self._size, self._last_used = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM cache"
+        ).fetchone()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self.ttls:
+            return self._cached(name)
+        if name.startswith(READ_METHOD_PREFIXES) or self.allow_writes:
+            return getattr(self._client, name)
+
+        raise AttributeError(
+            "{} is not available on a read-only caching client, pass allow_writes=True to use it".format(name)
+        )
+
+    def _cached(self, name):
+        # Iterator methods are cached as the list of everything they return
+        is_iter = name.endswith('_iter')
+
+        def inner(*args, **kwargs):
+            key = json.dumps([self._base_url, name, args, kwargs], sort_keys=True)
+            found, response = self._get(name, key)
+            if not found:
+                response = getattr(self._client, name)(*args, **kwargs)
+                if is_iter:
+                    response = list(response)
+                self._set(key, response)
+
+            return iter(response) if is_iter else response
+
+        return inner
+
+    def _get(self, name, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or self._clock() - row[1] >= self.ttls[name]:
+                self.misses[name] += 1
+                return False, None
+
+            self.hits[name] += 1
+            self._last_used += 1
+            self._connection.execute("UPDATE cache SET last_used = ? WHERE key = ?", (self._last_used, key))
+            self._connection.commit()
+
+            return True, json.loads(row[0])
+
+    def _set(self, key, response):
+        data = json.dumps(response)
+
+        with self._lock:
+            old = self._connection.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._size -= old[0]
+
+            self._last_used += 1
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), self._clock(), self._last_used)
+            )
+            self._size += len(data)
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        while self._size > self.max_size:
+            key, size = self._connection.execute(
+                "SELECT key, size FROM cache ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            name: {'hits': self.hits[name], 'misses': self.misses[name]}
+            for name in set(self.hits) | set(self.misses)
+        }
+
+    def close(self):
+        self._connection.close()
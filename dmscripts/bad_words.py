@@ -0,0 +1,545 @@
+import collections
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import unicodedata
+from multiprocessing.pool import ThreadPool
+if sys.version_info > (3, 0):
+    import csv
+else:
+    import unicodecsv as csv
+
+import six
+
+
+FIELDNAMES = [
+    'Supplier ID',
+    'Framework',
+    'Service ID',
+    'Service Title',
+    'Service Description',
+    'Blacklisted Word Location',
+    'Blacklisted Word Context',
+    'Blacklisted Word',
+]
+COMPACT_FIELDNAMES = FIELDNAMES + ['Blacklisted Word Offsets']
+
+# Characters either side of each match in JSON lines output when no context is set
+DEFAULT_JSONL_CONTEXT = 40
+
+# Bumped whenever the format of cached matches changes, so that old caches are ignored
+CACHE_FORMAT = 1
+
+_NON_ASCII = re.compile(u'[^\x00-\x7f]')
+
+
+class Normaliser(object):
+    """Normalise text for matching, keeping a map from normalised back to original offsets
+
+    Each character is case folded, decomposed with NFKD with any combining marks
+    (accents) dropped, then replaced using `substitutions`, a dict from single
+    characters to replacement text, eg ``{'0': 'o', '4': 'a'}``. The result for each
+    character is remembered in a translation table, so whole strings are normalised
+    with a single `translate` call, or with string methods if they are all ASCII.
+    Offsets are only mapped a character at a time for text containing a character
+    that normalises to more or less than one character.
+
+    """
+    def __init__(self, substitutions=None):
+        self.substitutions = substitutions or {}
+        self._table = {}
+        self._changes_length = set()
+
+        ascii_substitutions = dict(
+            (ord(character), replacement) for character, replacement in self.substitutions.items()
+            if not _NON_ASCII.search(character)
+        )
+        # ASCII text only keeps its offsets if every substitution is a single character
+        if all(len(replacement) == 1 for replacement in ascii_substitutions.values()):
+            self._ascii_table = ascii_substitutions
+        else:
+            self._ascii_table = None
+
+    def normalise_character(self, character):
+        if ord(character) not in self._table:
+            folded = getattr(character, 'casefold', character.lower)()
+            decomposed = unicodedata.normalize('NFKD', folded)
+            replacement = u''.join(
+                self.substitutions.get(c, c) for c in decomposed if not unicodedata.combining(c)
+            )
+            self._table[ord(character)] = replacement
+            if len(replacement) != 1:
+                self._changes_length.add(character)
+
+        return self._table[ord(character)]
+
+    def normalise(self, text):
+        """Return the normalised text, and a list of the offset in `text` of each normalised character
+
+        The offset map is None if the normalised text has the same offsets as `text`.
+
+        """
+        text = six.text_type(text)
+        if self._ascii_table is not None and not _NON_ASCII.search(text):
+            lowered = text.lower()
+            return lowered.translate(self._ascii_table) if self._ascii_table else lowered, None
+
+        characters = set(text)
+        for character in characters:
+            self.normalise_character(character)
+
+        normalised = text.translate(self._table)
+        if characters.isdisjoint(self._changes_length):
+            return normalised, None
+
+        offsets = []
+        for offset, character in enumerate(text):
+            offsets.extend([offset] * len(self._table[ord(character)]))
+
+        return normalised, offsets
+
+
+def _is_word_character(character):
+    return re.match(r'\w', character, re.UNICODE) is not None
+
+
+def _trie_pattern(trie):
+    """Build a regular expression matching every word in a trie of lowercase words
+
+    Words sharing a prefix share a branch of the pattern, so the regular expression
+    engine only tries the alternatives that can still match at each character
+    rather than every word in turn.
+
+    """
+    alternatives = []
+    optional = False
+    for character in sorted(trie):
+        if character == '':
+            optional = True
+        else:
+            alternatives.append(re.escape(character) + _trie_pattern(trie[character]))
+
+    if not alternatives:
+        return ''
+
+    if len(alternatives) == 1 and not optional:
+        return alternatives[0]
+
+    pattern = '(?:{})'.format('|'.join(alternatives))
+    return pattern + '?' if optional else pattern
+
+
+class BadWordsMatcher(object):
+    """Find every bad word in a piece of text in a single pass
+
+    Matches are whole words only, in the same way as searching for ``\\bword\\b``
+    once per word, but the words are compiled into one regular expression up front
+    so the cost of a scan depends on the length of the text rather than the length
+    of the text multiplied by the number of words.
+
+    Both the words and the text are normalised first (see `Normaliser`), so matches
+    ignore case and accents and apply any `substitutions`. Offsets are still
+    offsets in the original text.
+
+    """
+    def __init__(self, words, substitutions=None):
+        self.normaliser = Normaliser(substitutions)
+        self.words = {}
+        for word in words:
+            self.words.setdefault(self.normaliser.normalise(word)[0], word)
+
+        trie = {}
+        for word in self.words:
+            node = trie
+            for character in word:
+                node = node.setdefault(character, {})
+            node[''] = {}
+
+        # Words that are themselves a whole-word prefix of a longer word, eg "bad" in
+        # "bad word", can't be matched separately at the same position, so they are
+        # looked up when the longer word matches.
+        self._prefixes = {}
+        for word in self.words:
+            self._prefixes[word] = [
+                word[:i] for i in range(1, len(word))
+                if word[:i] in self.words and
+                _is_word_character(word[i - 1]) != _is_word_character(word[i])
+            ]
+
+        # The lookahead doesn't consume any text so that words overlapping an earlier
+        # match, eg "word" in "bad word", are still found.
+        pattern = r'\b(?=({})\b)'.format(_trie_pattern(trie)) if trie else r'(?!)'
+        self._regex = re.compile(pattern, re.UNICODE)
+
+    def find(self, value):
+        """Return a list of ``(word, offset, end)`` for each bad word in `value` in order of offset
+
+        `offset` and `end` are the start and end of the matched text in `value`, which
+        can be a different length to the word, eg with ligatures or substitutions that
+        replace one character with several.
+
+        """
+        normalised, offsets = self.normaliser.normalise(value)
+
+        matches = []
+        for match in self._regex.finditer(normalised):
+            found = match.group(1)
+            offset = offsets[match.start()] if offsets else match.start()
+            for word in self._prefixes[found] + [found]:
+                end = match.start() + len(word)
+                matches.append((self.words[word], offset, offsets[end - 1] + 1 if offsets else end))
+
+        return matches
+
+
+def get_suppliers(client, framework_slug):
+    suppliers = client.find_framework_suppliers(framework_slug)
+    suppliers = suppliers["supplierFrameworks"]
+    if (framework_slug == "g-cloud-6"):
+        suppliers_on_framework = suppliers
+    else:
+        suppliers_on_framework = [supplier for supplier in suppliers if supplier["onFramework"]]
+    return suppliers_on_framework
+
+
+def get_draft_services(client, supplier_id, framework_slug):
+    services = client.find_draft_services(supplier_id, framework=framework_slug)
+    services = services["services"]
+    submitted_services = [service for service in services if service["status"] == "submitted"]
+    return submitted_services
+
+
+def get_services(client, supplier_id, framework_slug):
+    services = client.find_services(supplier_id, framework=framework_slug)
+    services = services["services"]
+    return services
+
+
+def add_services(client):
+    def inner(supplier):
+        if supplier["frameworkSlug"] == "g-cloud-6":
+            services = get_services(client, supplier["supplierId"], supplier["frameworkSlug"])
+        else:
+            services = get_draft_services(client, supplier["supplierId"], supplier["frameworkSlug"])
+
+        return supplier, services
+
+    return inner
+
+
+def find_services_by_supplier(client, suppliers, workers=10):
+    """Yield ``(supplier, services)`` for each supplier in order of supplier id
+
+    Services are fetched by `workers` threads, so up to `workers` suppliers are
+    requested from the API at once, but results are still yielded in order.
+
+    """
+    pool = ThreadPool(workers)
+    try:
+        for result in pool.imap(add_services(client), sorted(suppliers, key=lambda s: s["supplierId"])):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def get_bad_words(bad_words_path):
+    with io.open(bad_words_path, encoding='utf-8') as file:
+        lines = file.readlines()
+        return [line.strip() for line in lines if not (line.startswith("#") or line.isspace())]
+
+
+def get_substitutions(substitutions_path):
+    """Read a JSON object mapping single characters to their replacements, eg ``{"0": "o"}``"""
+    with open(substitutions_path) as file:
+        return json.load(file)
+
+
+def get_field_values(service):
+    """Yield ``(JSON path, text)`` for each string or number anywhere in a service
+
+    Nested dicts and lists are walked with a stack rather than recursively, in the
+    order they appear. Paths look like ``serviceName``, ``serviceFeatures[2]`` or
+    ``pricing.prices[0].unit``.
+
+    """
+    stack = [(key, service[key]) for key in reversed(list(service))]
+    while stack:
+        path, value = stack.pop()
+        if isinstance(value, six.string_types):
+            yield path, value
+        elif isinstance(value, dict):
+            stack.extend((u'{}.{}'.format(path, key), value[key]) for key in reversed(list(value)))
+        elif isinstance(value, list):
+            stack.extend((u'{}[{}]'.format(path, index), value[index]) for index in reversed(range(len(value))))
+        elif isinstance(value, six.integer_types + (float,)) and not isinstance(value, bool):
+            yield path, six.text_type(value)
+
+
+def find_bad_words_in_service(matcher, service):
+    """Yield ``(JSON path, text, [(word, offset, end), ...])`` for each value containing bad words"""
+    for path, value in get_field_values(service):
+        matches = matcher.find(value)
+        if matches:
+            yield path, value, matches
+
+
+def scan_services(matcher, services):
+    """Return a list of ``(JSON path, text, [(word, offset, end), ...])`` matches for each service"""
+    return [list(find_bad_words_in_service(matcher, service)) for service in services]
+
+
+_worker_matcher = None
+
+
+def _start_scan_worker(bad_words, substitutions):
+    global _worker_matcher
+    _worker_matcher = BadWordsMatcher(bad_words, substitutions)
+
+
+def _scan_chunk(services):
+    return scan_services(_worker_matcher, services)
+
+
+def words_version(bad_words, substitutions=None):
+    return hashlib.sha1(
+        json.dumps([bad_words, substitutions or {}], sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def service_hash(service):
+    return hashlib.sha1(json.dumps(service, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ScanCache(object):
+    """Matches from previous scans, stored by service id with a hash of the service
+
+    A cached result is only used if the service is unchanged and the cache was
+    written with the same word list and substitutions. Only results for services looked up or stored
+    in this run are saved, so services that no longer exist are dropped.
+
+    """
+    def __init__(self, cache_file, bad_words, substitutions=None):
+        self.cache_file = cache_file
+        self.version = words_version(bad_words, substitutions)
+        self.results = {}
+        self._current = {}
+
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                cache = json.load(f)
+            if cache.get('format') == CACHE_FORMAT and cache['wordsVersion'] == self.version:
+                self.results = cache['services']
+
+    def get(self, service):
+        """Return the cached matches for `service`, or None if it has to be scanned"""
+        cached = self.results.get(six.text_type(service['id']))
+        if cached is None or cached['hash'] != service_hash(service):
+            return None
+
+        self._current[six.text_type(service['id'])] = cached
+        return [
+            (key, value, [tuple(match) for match in matches]) for key, value, matches in cached['matches']
+        ]
+
+    def set(self, service, matches):
+        self._current[six.text_type(service['id'])] = {'hash': service_hash(service), 'matches': matches}
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run can't leave a truncated cache
+        with open(self.cache_file + '.tmp', 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'wordsVersion': self.version, 'services': self._current}, f)
+        os.rename(self.cache_file + '.tmp', self.cache_file)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def scan_for_bad_words(supplier_services, bad_words, processes=None, chunk_size=100, cache=None,
+                       substitutions=None, max_in_flight=None):
+    """Yield ``(supplier, service, JSON path, text, [(word, offset, end), ...])`` for each value
+    containing bad words in an iterable of ``(supplier, service)`` pairs
+
+    Services are scanned in the current process unless `processes` is set, in which
+    case they are sent in chunks of `chunk_size` to a pool of worker processes, each
+    with its own matcher, so scanning isn't limited to one core. Results are yielded in
+    the same order either way. At most `max_in_flight` chunks (twice the number of
+    processes by default) are read from `supplier_services` ahead of the results being
+    yielded, so the pool can't pull in every service before they're written out.
+
+    If a `cache` is given, services it has results for aren't scanned again.
+
+    """
+    # Chunks waiting for their scan results, with any cached matches
+    pending = collections.deque()
+    in_flight = threading.Semaphore(max_in_flight or (processes or 1) * 2)
+    stopped = []
+
+    def services_to_scan():
+        chunks = chunked(supplier_services, chunk_size)
+        while True:
+            # Wait for a slot before reading the next chunk's services
+            in_flight.acquire()
+            chunk = None if stopped else next(chunks, None)
+            if chunk is None:
+                return
+            cached = [cache.get(service) if cache else None for supplier, service in chunk]
+            pending.append((chunk, cached))
+            yield [service for (supplier, service), matches in zip(chunk, cached) if matches is None]
+
+    pool = None
+    if processes:
+        pool = multiprocessing.Pool(processes, _start_scan_worker, (bad_words, substitutions))
+        results = pool.imap(_scan_chunk, services_to_scan())
+    else:
+        matcher = BadWordsMatcher(bad_words, substitutions)
+        results = (scan_services(matcher, services) for services in services_to_scan())
+
+    try:
+        for scanned in results:
+            scanned = iter(scanned)
+            chunk, cached = pending.popleft()
+            in_flight.release()
+            for (supplier, service), matches in zip(chunk, cached):
+                if matches is None:
+                    matches = next(scanned)
+                    if cache:
+                        cache.set(service, matches)
+
+                for key, value, found in matches:
+                    yield supplier, service, key, value, found
+    finally:
+        if pool:
+            # Let the pool's task thread out of services_to_scan if it's waiting for a slot
+            stopped.append(True)
+            in_flight.release()
+            pool.terminate()
+
+
+def context_snippet(value, offset, length, context):
+    """Return `context` characters either side of a match, marking where the text has been cut"""
+    start = max(0, offset - context)
+    end = offset + length + context
+    return u'{}{}{}'.format(u'...' if start > 0 else u'', value[start:end], u'...' if end < len(value) else u'')
+
+
+def unique_words(matches):
+    words = []
+    for word, offset, end in matches:
+        if word not in words:
+            words.append(word)
+    return words
+
+
+def check_services_with_bad_words(output_dir, framework_slug, client, suppliers, bad_words, workers=10,
+                                  processes=None, cache_file=None, context=None, jsonl=False,
+                                  substitutions=None):
+    """Write a CSV report of the bad words in each supplier's services
+
+    By default there is a row for each bad word in each value, with the whole
+    value as context. If `context` is set there is one row for each value
+    instead, with `context` characters either side of each match and the offsets of
+    the matches. If `jsonl` is set every match is also written to a JSON lines file.
+
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    cache = ScanCache(cache_file, bad_words, substitutions) if cache_file else None
+    supplier_services = (
+        (supplier, service)
+        for supplier, services in find_services_by_supplier(client, suppliers, workers)
+        for service in services
+    )
+
+    output_path = '{}/{}-services-with-blacklisted-words'.format(output_dir, framework_slug)
+    with open(output_path + '.csv', 'w') as csvfile:
+        writer = csv.DictWriter(
+            csvfile, fieldnames=FIELDNAMES if context is None else COMPACT_FIELDNAMES, dialect='excel'
+        )
+        writer.writeheader()
+        jsonl_file = open(output_path + '.jsonl', 'w') if jsonl else None
+        try:
+            for supplier, service, key, value, matches in scan_for_bad_words(
+                    supplier_services, bad_words, processes, cache=cache, substitutions=substitutions):
+                if context is None:
+                    for word in unique_words(matches):
+                        output_bad_words(
+                            supplier["supplierId"], supplier["frameworkSlug"], service["id"],
+                            service["serviceName"], service["serviceSummary"], key,
+                            value, word, writer)
+                else:
+                    output_compact_bad_words(supplier, service, key, value, matches, context, writer)
+
+                if jsonl_file:
+                    output_bad_words_jsonl(supplier, service, key, value, matches, context, jsonl_file)
+        finally:
+            if jsonl_file:
+                jsonl_file.close()
+
+    if cache:
+        cache.save()
+
+
+def output_bad_words(
+        supplier_id, framework, service_id, service_title,
+        service_description, blacklisted_word_location,
+        blacklisted_word_context, blacklisted_word, writer):
+    row = {
+        'Supplier ID': supplier_id,
+        'Framework': framework,
+        'Service ID': service_id,
+        'Service Title': service_title,
+        'Service Description': service_description,
+        'Blacklisted Word Location': blacklisted_word_location,
+        'Blacklisted Word Context': blacklisted_word_context,
+        'Blacklisted Word': blacklisted_word,
+    }
+    writer.writerow(row)
+
+
+def output_compact_bad_words(supplier, service, key, value, matches, context, writer):
+    writer.writerow({
+        'Supplier ID': supplier["supplierId"],
+        'Framework': supplier["frameworkSlug"],
+        'Service ID': service["id"],
+        'Service Title': service["serviceName"],
+        'Service Description': service["serviceSummary"],
+        'Blacklisted Word Location': key,
+        'Blacklisted Word Context': u' | '.join(
+            context_snippet(value, offset, end - offset, context) for word, offset, end in matches
+        ),
+        'Blacklisted Word': u'; '.join(unique_words(matches)),
+        'Blacklisted Word Offsets': u'; '.join(six.text_type(offset) for word, offset, end in matches),
+    })
+
+
+def output_bad_words_jsonl(supplier, service, key, value, matches, context, jsonl_file):
+    if context is None:
+        context = DEFAULT_JSONL_CONTEXT
+
+    jsonl_file.write(json.dumps({
+        'supplierId': supplier["supplierId"],
+        'frameworkSlug': supplier["frameworkSlug"],
+        'serviceId': service["id"],
+        'location': key,
+        'matches': [
+            {
+                'word': word,
+                'offset': offset,
+                'end': end,
+                'context': context_snippet(value, offset, end - offset, context),
+            }
+            for word, offset, end in matches
+        ],
+    }, sort_keys=True) + '\n')
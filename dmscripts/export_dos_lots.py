@@ -0,0 +1,174 @@
+import os
+import sys
+
+from dmscripts.export_dos_suppliers import (
+    FRAMEWORK_SLUG, add_supplier_info, add_framework_info, add_draft_services, find_suppliers,
+    make_fields_from_content_questions
+)
+from dmscripts.pipeline import Pipeline
+
+if sys.version_info[0] < 3:
+    import unicodecsv as csv
+else:
+    import csv
+
+
+def supplier_status_row(record):
+    return [
+        ("supplier_id", record["supplier_id"]),
+        ("supplier_name", record['supplier']['name']),
+        ("supplier_declaration_name", record['declaration'].get('nameOfOrganisation', '')),
+        ("status", "PASSED" if record["onFramework"] else "FAILED"),
+    ]
+
+
+def get_specialist_roles(section):
+    return [
+        question
+        for outer_question in section.questions
+        for question in outer_question.questions
+    ]
+
+
+def make_specialists_row(content_manifest):
+    section = content_manifest.get_section("individual-specialist-roles")
+    specialist_roles = list(get_specialist_roles(section))
+
+    def inner(record):
+        return supplier_status_row(record) + make_fields_from_content_questions(specialist_roles, record)
+
+    return inner
+
+
+def get_team_capabilities(content_manifest):
+    section = content_manifest.get_section("team-capabilities")
+
+    return [
+        question.questions[0]
+        for question in section.questions
+    ]
+
+
+def get_outcomes_locations(content_manifest):
+    return [
+        content_manifest.get_question("locations")
+    ]
+
+
+def make_outcomes_row(capabilities, locations):
+    def inner(record):
+        return supplier_status_row(record) + \
+            make_fields_from_content_questions(capabilities + locations, record)
+
+    return inner
+
+
+def make_participants_row(content_manifest):
+    question_ids = ["recruitMethods", "recruitFromList", "locations"]
+    questions = [content_manifest.get_question(question_id) for question_id in question_ids]
+
+    def inner(record):
+        return supplier_status_row(record) + make_fields_from_content_questions(questions, record)
+
+    return inner
+
+
+def make_labs_row(service):
+    bad_fields = ['links']
+    return sorted((key, value) for key, value in service.items() if key not in bad_fields)
+
+
+class SupplierLotHandler(object):
+    """One row for each supplier with submitted services in a lot, made from the supplier's record"""
+    def __init__(self, lot, filename, make_row):
+        self.lot = lot
+        self.filename = filename
+        self.make_row = make_row
+
+    def create_rows(self, record):
+        services = [
+            draft for draft in record["services"]
+            if draft["lotSlug"] == self.lot and draft["status"] == "submitted"
+        ]
+        if services:
+            yield self.make_row(dict(record, services=services))
+
+
+class LabsHandler(object):
+    """One row for each submitted user research studio from suppliers on the framework"""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def create_rows(self, record):
+        if record['onFramework']:
+            for service in record['services']:
+                if service['lot'] == 'user-research-studios' and service['status'] == 'submitted':
+                    yield make_labs_row(service)
+
+
+def make_lot_handlers(content_manifest, output_dir):
+    return [
+        SupplierLotHandler("digital-specialists", os.path.join(output_dir, "dos-specialists.csv"),
+                           make_specialists_row(content_manifest)),
+        SupplierLotHandler("digital-outcomes", os.path.join(output_dir, "dos-outcomes.csv"),
+                           make_outcomes_row(get_team_capabilities(content_manifest),
+                                             get_outcomes_locations(content_manifest))),
+        SupplierLotHandler("user-research-participants",
+                           os.path.join(output_dir, "dos-user-research-participants.csv"),
+                           make_participants_row(content_manifest)),
+        LabsHandler(os.path.join(output_dir, "dos-labs.csv")),
+    ]
+
+
+class LotCSVWriter(object):
+    """Write the rows each handler makes from a record to the handler's own CSV file"""
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self._csv_files = dict()
+        self._csv_writers = dict()
+
+    def write_record(self, record):
+        for handler in self.handlers:
+            for row in handler.create_rows(record):
+                self.csv_writer(handler, row).writerow(dict(row))
+
+    def csv_writer(self, handler, row):
+        if handler.filename not in self._csv_writers:
+            fieldnames = [key for key, _ in row]
+            self._csv_writers[handler.filename] = csv.DictWriter(self._csv_files[handler.filename],
+                                                                 fieldnames=fieldnames)
+            self._csv_writers[handler.filename].writeheader()
+
+        return self._csv_writers[handler.filename]
+
+    def __enter__(self):
+        for handler in self.handlers:
+            self._csv_files[handler.filename] = open(handler.filename, 'w+')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for f in self._csv_files.values():
+            f.close()
+
+
+def find_suppliers_with_drafts(client, framework_slug):
+    pipeline = Pipeline() \
+        .map(add_supplier_info(client)) \
+        .map(add_framework_info(client, framework_slug)) \
+        .map(add_draft_services(client, framework_slug))
+
+    return pipeline.run(find_suppliers(client, framework_slug))
+
+
+def export_all_lots(client, content_manifest, output_dir):
+    """Fetch every interested supplier's details and drafts once and write the CSV file for each lot"""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    handlers = make_lot_handlers(content_manifest, output_dir)
+
+    with LotCSVWriter(handlers) as writer:
+        for record in find_suppliers_with_drafts(client, FRAMEWORK_SLUG):
+            sys.stdout.write(".")
+            sys.stdout.flush()
+            writer.write_record(record)
@@ -1,13 +1,9 @@
 import os
 import sys
-from multiprocessing.pool import ThreadPool
 
 from dmapiclient import HTTPError
-from dmscripts.insert_dos_framework_results import (
-    CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE, CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE,
-    CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE, MITIGATING_FACTORS,
-    CORRECT_DECLARATION_RESPONSES
-)
+from dmscripts.pipeline import Pipeline
+from dmscripts.insert_dos_framework_results import DeclarationRules, DISCRETIONARY_RULES, is_allowed_answer
 
 if sys.version_info[0] < 3:
     import unicodecsv as csv
@@ -132,44 +128,23 @@ def add_draft_counts(client, framework_slug):
     return inner
 
 
-def get_declaration_questions(declaration_content, record):
-    for section in declaration_content:
-        for question in section.questions:
-            yield question, record['declaration'].get(question.id)
-
-
-def is_incorrect_mandatory_question(question, answer):
-    if question.number in CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE and answer is not True:
-        return True
-    if question.number in CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE and answer is not False:
-        return True
-    if question.number in CORRECT_DECLARATION_RESPONSES:
-        if answer not in CORRECT_DECLARATION_RESPONSES[question.number]:
-            return True
-
-    return False
-
-
 def add_failed_questions(declaration_content):
+    declaration_rules = DeclarationRules(declaration_content)
+
     def inner(record):
         if record['declaration'].get('status') != 'complete':
             return dict(record,
                         failed_mandatory=['INCOMPLETE'],
                         discretionary=[])
 
-        declaration_questions = list(get_declaration_questions(declaration_content, record))
-
-        failed_mandatory = [
-            "Q{}".format(question.number)
-            for question, answer in declaration_questions
-            if is_incorrect_mandatory_question(question, answer)
-        ]
-
-        discretionary = [
-            ("Q{}".format(question.number), answer)
-            for question, answer in declaration_questions
-            if question.number in CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE + MITIGATING_FACTORS
-        ]
+        failed_mandatory = []
+        discretionary = []
+        for question_id, rule in declaration_rules.questions():
+            answer = record['declaration'].get(question_id)
+            if rule.kind in DISCRETIONARY_RULES:
+                discretionary.append(("Q{}".format(rule.number), answer))
+            elif not is_allowed_answer(rule, answer):
+                failed_mandatory.append("Q{}".format(rule.number))
 
         return dict(record,
                     failed_mandatory=failed_mandatory,
@@ -179,30 +154,28 @@ def add_failed_questions(declaration_content):
 
 
 def find_services_by_lot(client, framework_slug, lot_slug):
-    pool = ThreadPool(30)
     service_adder = add_draft_services(client, framework_slug,
                                        lot=lot_slug,
                                        status="submitted")
 
-    records = find_suppliers(client, framework_slug)
-    records = pool.imap(add_supplier_info(client), records)
-    records = pool.imap(add_framework_info(client, framework_slug), records)
-    records = pool.imap(service_adder, records)
-    records = filter(lambda record: len(record["services"]) > 0, records)
+    pipeline = Pipeline() \
+        .map(add_supplier_info(client)) \
+        .map(add_framework_info(client, framework_slug)) \
+        .map(service_adder) \
+        .filter(lambda record: len(record["services"]) > 0)
 
-    return records
+    return pipeline.run(find_suppliers(client, framework_slug))
 
 
 def find_suppliers_with_details(client, content_loader, framework_slug, supplier_ids=None):
-    pool = ThreadPool(30)
-
     content_loader.load_manifest(framework_slug, 'declaration', 'declaration')
     declaration_content = content_loader.get_manifest(framework_slug, 'declaration')
 
-    records = find_suppliers(client, framework_slug, supplier_ids)
-    records = pool.imap(add_supplier_info(client), records)
-    records = pool.imap(add_framework_info(client, framework_slug), records)
-    records = pool.imap(add_draft_counts(client, framework_slug), records)
+    pipeline = Pipeline() \
+        .map(add_supplier_info(client)) \
+        .map(add_framework_info(client, framework_slug)) \
+        .map(add_draft_counts(client, framework_slug))
+    records = pipeline.run(find_suppliers(client, framework_slug, supplier_ids))
     records = map(add_failed_questions(declaration_content), records)
 
     return records
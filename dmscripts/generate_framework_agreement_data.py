@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import os
-from dmapiclient import HTTPError
 from dmutils.documents import sanitise_supplier_name
 
 import sys
@@ -9,6 +8,11 @@ if sys.version_info > (3, 0):
 else:
     import unicodecsv as csv
 
+LOTS_COLUMNS = 11
+LOTS_REQUIRED_FIELDS = [0, 3, 5, 7, 9]
+DECLARATION_COLUMNS = 59
+DECLARATION_REQUIRED_FIELDS = [0, 18, 19, 20, 21, 26, 27]
+
 
 class Supplier:
 
@@ -52,22 +56,47 @@ def read_csv(filepath):
     return all_rows
 
 
+def read_validated_csv(filepath, row_errors, errors):
+    """Yield the valid rows of a CSV file one at a time, skipping any column titles row
+
+    `row_errors` returns a list of problems with a row. Rows with problems are
+    skipped and each problem is added to `errors` as ``(row number, message)``, with
+    rows numbered from 1 at the top of the file, so that every problem in the file
+    can be reported at once.
+
+    """
+    with open(filepath, 'r') as csvfile:
+        csv_file = csv.reader(csvfile, delimiter=',', quotechar='"')
+        for row_number, row in enumerate(csv_file, start=1):
+            if row_number == 1 and row and row[0] == "Digital Marketplace ID":
+                continue
+
+            problems = row_errors(row)
+            if problems:
+                errors.extend((row_number, problem) for problem in problems)
+            else:
+                yield row
+
+
 def make_filename_key(supplier_name, supplier_id):
     return "{}-{}".format(sanitise_supplier_name(supplier_name), supplier_id)
 
 
-def supplier_is_on_framework(client, supplier_id):
-    try:
-        framework_interest = client.get_supplier_framework_info(supplier_id, 'g-cloud-7')
-        return framework_interest['frameworkInterest']['onFramework']
-    except HTTPError as e:
-        print("ERROR checking if supplier {} is on framework: {}".format(supplier_id, str(e)))
-        return False
+def find_on_framework_statuses(client, framework_slug='g-cloud-7'):
+    """Fetch whether each supplier is on the framework in one request, keyed by supplier ID as text"""
+    return {
+        str(supplier_framework['supplierId']): supplier_framework['onFramework']
+        for supplier_framework in client.find_framework_suppliers(framework_slug)['supplierFrameworks']
+    }
 
 
 def build_framework_agreements(client, declarations, lots, output_dir):
+    on_framework_statuses = find_on_framework_statuses(client)
+    lot_counts = index_lot_counts(lots)
+
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
+    no_lots = []
     with open('{}/g7-framework-data.tsv'.format(output_dir), 'w') as csvfile:
         with open('{}/g7-fail-data.tsv'.format(output_dir), 'w') as failfile:
             # This defines the order of the fields - fields can be in any order in
@@ -103,10 +132,16 @@ def build_framework_agreements(client, declarations, lots, output_dir):
 
             for declaration in declarations:
                 supplier_id = declaration[0]
-                on_framework = supplier_is_on_framework(client, supplier_id)
+                if supplier_id in on_framework_statuses:
+                    on_framework = on_framework_statuses[supplier_id]
+                else:
+                    print("ERROR checking if supplier {} is on framework: no framework interest".format(supplier_id))
+                    on_framework = False
                 if on_framework is True:
-                    lot_count = lot_counts_for_supplier_id(lots, supplier_id)
-                    if lot_count:
+                    lot_count = lot_counts_for_supplier_id(lot_counts, supplier_id)
+                    if lot_count is None:
+                        no_lots.append(declaration)
+                    else:
                         supplier = Supplier(declaration, lot_count)
                         row = {
                             'Key': make_filename_key(supplier.registered_company_name, supplier.supplier_id),
@@ -140,13 +175,50 @@ def build_framework_agreements(client, declarations, lots, output_dir):
                     print("Supplier did not apply: {}".format(supplier_id))
                     continue
 
+    write_no_lots_report(no_lots, output_dir)
 
-def lot_counts_for_supplier_id(lot_counts, supplier_id):
+
+def write_no_lots_report(declarations, output_dir):
+    """Write the suppliers on the framework whose declarations have no lot counts"""
+    with open('{}/g7-no-lots-data.tsv'.format(output_dir), 'w') as nolotsfile:
+        writer = csv.DictWriter(nolotsfile, fieldnames=['Key', 'Supplier ID', 'Registered Company Name'],
+                                dialect='excel-tab')
+        writer.writeheader()
+        for declaration in declarations:
+            supplier = FailedSupplier(declaration)
+            writer.writerow({
+                'Key': make_filename_key(supplier.registered_company_name, supplier.supplier_id),
+                'Supplier ID': supplier.supplier_id,
+                'Registered Company Name': supplier.registered_company_name,
+            })
+
+
+def index_lot_counts(lot_counts):
+    """Key lot count rows by supplier ID
+
+    Raises ValueError if a supplier ID appears more than once, as it isn't clear
+    which row should be used.
+
+    """
+    index = {}
+    duplicates = []
     for lot_count in lot_counts:
-        if lot_count[0] == supplier_id:
-            return lot_count
-    print("No lot counts for supplier: {}".format(supplier_id))
-    return None
+        if lot_count[0] in index:
+            duplicates.append(lot_count[0])
+        index[lot_count[0]] = lot_count
+
+    if duplicates:
+        raise ValueError("Duplicate supplier IDs in lots: {}".format(", ".join(map(str, duplicates))))
+
+    return index
+
+
+def lot_counts_for_supplier_id(lot_counts, supplier_id):
+    """Look up a supplier's lot counts in lot counts indexed with `index_lot_counts`"""
+    lot_count = lot_counts.get(supplier_id)
+    if lot_count is None:
+        print("No lot counts for supplier: {}".format(supplier_id))
+    return lot_count
 
 
 def check_lots_csv(lots_file):
@@ -162,20 +234,41 @@ def check_lots_csv(lots_file):
     >>> check_lots_csv(f)
     (False, "Row missing required field [93584, 'Akamai Technologies Ltd', '', 1, 2, 0, 3, 0, 1, 2, 1]")
     """
-    columns = 11
-    required_fields = [0, 3, 5, 7, 9]
+    supplier_ids = set()
 
     for row in lots_file:
-        if len(row) != columns:
+        if len(row) != LOTS_COLUMNS:
             return False, "Row incorrect length"
 
-        for field in required_fields:
+        for field in LOTS_REQUIRED_FIELDS:
             if not row[field]:
                 return False, "Row missing required field {}".format(row)
 
+        if row[0] in supplier_ids:
+            return False, "Duplicate supplier ID {}".format(row[0])
+        supplier_ids.add(row[0])
+
     return True, "Lots file OK"
 
 
+def lots_row_errors():
+    """Return a function listing the problems with each row of a lots file, for `read_validated_csv`"""
+    supplier_ids = set()
+
+    def inner(row):
+        if len(row) != LOTS_COLUMNS:
+            return ["Row incorrect length"]
+
+        errors = ["Row missing required field {}".format(field) for field in LOTS_REQUIRED_FIELDS if not row[field]]
+        if row[0] in supplier_ids:
+            errors.append("Duplicate supplier ID {}".format(row[0]))
+        supplier_ids.add(row[0])
+
+        return errors
+
+    return inner
+
+
 def check_declarations_csv(declaration_file):
     """ Check a supplier declaraion file has right number of columns and all the required fields
     >>> f = [[92191, "Accenture (UK) Limited", 734939007, "yes", "yes", "yes", "yes", "yes", "yes", "failed", "yes", "yes", "yes", "yes", "yes", "Yes – your organisation has or will have in place, employer's liability insurance of at least £5 million and you will provide certification prior to framework award.", "failed", "a", "ashraf.chohan@digital.cabinet-office.gov.uk", "a", "a", "public limited company", "a", "a", "1976", "uk", "a", "123456789", "yes", "yes", "a", "licensed", "a", "micro", "yourself without the use of third parties (subcontractors)", "a", "ashraf.chohan@digital.cabinet-office.gov.uk", "no", "no", "no", "yes", "no", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "yes", "a", "yes", "yes", "a"]]  # noqa
@@ -188,19 +281,28 @@ def check_declarations_csv(declaration_file):
     >>> check_declarations_file(f)
     (False, 'Row missing required field row: 0 field: 2')
     """
-    columns = 59
-    required_fields = [0, 18, 19, 20, 21, 26, 27]
-
     for index, row in enumerate(declaration_file):
-        if len(row) != columns:
+        if len(row) != DECLARATION_COLUMNS:
             return False, "Row incorrect length row: {}".format(index)
 
         if row[3] == 'complete':
-            for field in required_fields:
+            for field in DECLARATION_REQUIRED_FIELDS:
                 if not row[field]:
                     return False, "Row missing required field row: {} field: {}".format(index, field)
     return True, "Declarations file OK"
 
+
+def declaration_row_errors(row):
+    """List the problems with a row of a declarations file, for `read_validated_csv`"""
+    if len(row) != DECLARATION_COLUMNS:
+        return ["Row incorrect length"]
+
+    if row[3] == 'complete':
+        return ["Row missing required field {}".format(field) for field in DECLARATION_REQUIRED_FIELDS
+                if not row[field]]
+
+    return []
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,1038 @@
+from __future__ import absolute_import
+
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+
+import backoff
+import dmapiclient
+import requests
+import six
+from dmutils.formats import DATETIME_FORMAT
+from requests.adapters import HTTPAdapter
+from six.moves import map, queue
+from six.moves.urllib.parse import urljoin
+
+from dmscripts.indexing_stats import IndexingStats
+
+logger = logging.getLogger('script')
+
+# How far before the start of a run the saved watermark can be, to allow for clock
+# differences between this host and the data API
+WATERMARK_SAFETY_MARGIN = timedelta(minutes=5)
+
+
+def make_session(pool_size):
+    """Create a requests session that keeps up to `pool_size` connections open per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class SearchAPIClient(dmapiclient.SearchAPIClient):
+    """SearchAPIClient with support for the search-api bulk documents endpoint
+
+    If a `session` is given requests are sent through it, so connections are reused
+    between requests instead of opening a new TCP/TLS connection for each one. Time
+    spent serialising and sending those requests is recorded in `stats` if given.
+
+    """
+    def __init__(self, base_url=None, auth_token=None, enabled=True, session=None, stats=None):
+        super(SearchAPIClient, self).__init__(base_url, auth_token, enabled)
+        self.session = session
+        self.stats = stats or IndexingStats()
+
+    def _request(self, method, url, data=None, params=None, **kwargs):
+        if self.session is None:
+            return super(SearchAPIClient, self)._request(method, url, data=data, params=params, **kwargs)
+        if not self.enabled:
+            return None
+
+        url = urljoin(self.base_url, url)
+        headers = {
+            "Content-type": "application/json",
+            "Authorization": "Bearer {}".format(self.auth_token),
+            "User-agent": "DM-API-Client/{}".format(dmapiclient.__version__),
+        }
+
+        with self.stats.time('serialise'):
+            body = json.dumps(data) if data is not None else None
+
+        try:
+            with self.stats.time('search_api_request'):
+                response = self.session.request(method, url, headers=headers, data=body, params=params)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise dmapiclient.HTTPError.create(e)
+
+        try:
+            return response.json()
+        except ValueError:
+            raise dmapiclient.InvalidResponse(response, message="No JSON object could be decoded")
+
+    def bulk(self, operations, index):
+        """Apply a list of index/delete operations in a single request
+
+        :param operations: a list of ``{'action': 'index', 'id': ..., 'service': ...}``
+                           or ``{'action': 'delete', 'id': ...}`` dicts
+        :param index: search-api index name
+
+        :return: response with a ``results`` list containing a ``{'id', 'status', 'error'}``
+                 entry for each operation, in the same order as ``operations``
+
+        dmapiclient's SearchAPIClient has no bulk method, as this endpoint is only
+        served by versions of search-api with bulk indexing support. Older versions
+        respond with a 404.
+
+        """
+        return self._post('/{}/services/bulk'.format(index), data={'operations': operations})
+
+    def count_documents(self, index):
+        return self._get('/{}/services/search'.format(index))['meta']['total']
+
+    def iter_documents(self, index):
+        """Yield every document in the index, following search result pages"""
+        page = 1
+        while True:
+            response = self._get('/{}/services/search'.format(index), params={'page': page})
+            for document in response['services']:
+                yield document
+
+            if 'next' not in response.get('links', {}):
+                return
+            page += 1
+
+
+def request_service_pages(api_url, api_access_token, frameworks, start_page=1, stats=None, page_step=1):
+    """Yield ``(page number, services)`` for each page of services from the data API
+
+    :param page_step: fetch every `page_step`th page from `start_page`, so that pages
+                      can be split between several processes
+
+    """
+    stats = stats or IndexingStats()
+
+    data_client = dmapiclient.DataAPIClient(
+        api_url,
+        api_access_token
+    )
+
+    page = start_page
+    while True:
+        try:
+            with stats.time('data_api_page_fetch'):
+                response = data_client.find_services(page=page, framework=frameworks)
+        except dmapiclient.HTTPError as e:
+            # Stepping through pages can go past the last one, which the data API returns as not found
+            if e.status_code == 404 and page > 1:
+                return
+            raise
+        yield page, response['services']
+
+        if 'next' not in response.get('links', {}):
+            return
+        page += page_step
+
+
+_END_OF_PAGES = object()
+
+
+class _PrefetchError(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def prefetch_pages(pages, depth, max_services=None):
+    """Fetch pages in a background thread so they're ready before they're needed
+
+    Up to `depth` pages are fetched ahead of the consumer, holding at most `max_services`
+    services in memory (a single page larger than that is still fetched). Errors from
+    fetching a page are raised to the consumer when it reaches that page. If the consumer
+    stops early the background thread stops after the page it is fetching.
+
+    """
+    buffered = queue.Queue(maxsize=depth)
+    capacity = threading.Condition()
+    buffered_services = [0]
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for page, services in pages:
+                with capacity:
+                    while (not stopped.is_set() and max_services and buffered_services[0] and
+                           buffered_services[0] + len(services) > max_services):
+                        capacity.wait()
+                    if stopped.is_set():
+                        return
+                    buffered_services[0] += len(services)
+                buffered.put((page, services))
+        except Exception:
+            if not stopped.is_set():
+                buffered.put(_PrefetchError(sys.exc_info()))
+        else:
+            if not stopped.is_set():
+                buffered.put(_END_OF_PAGES)
+
+    producer = threading.Thread(target=produce, name='prefetch-pages')
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            item = buffered.get()
+            if item is _END_OF_PAGES:
+                return
+            if isinstance(item, _PrefetchError):
+                six.reraise(*item.exc_info)
+
+            page, services = item
+            with capacity:
+                buffered_services[0] -= len(services)
+                capacity.notify()
+
+            yield page, services
+    finally:
+        stopped.set()
+        with capacity:
+            capacity.notify()
+        # Make room for a page the producer may be waiting to buffer
+        while True:
+            try:
+                buffered.get_nowait()
+            except queue.Empty:
+                break
+
+
+def flatten_pages(pages):
+    return (service for page, services in pages for service in services)
+
+
+def service_watermark(service):
+    """Return the ``(updatedAt, id)`` position of a service in update order"""
+    return service['updatedAt'], service['id']
+
+
+def load_watermark(state_file):
+    """Read the high-water mark saved by the last successful incremental run
+
+    Returns None if the state file doesn't exist yet, in which case every service
+    is considered changed.
+
+    """
+    if not os.path.exists(state_file):
+        return None
+
+    with open(state_file) as f:
+        state = json.load(f)
+
+    return state['updatedAt'], state['id']
+
+
+def save_watermark(state_file, watermark):
+    # Write to a temporary file first so an interrupted run can't leave a truncated state file
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump({'updatedAt': watermark[0], 'id': watermark[1]}, f)
+    os.rename(state_file + '.tmp', state_file)
+
+
+def changed_since(services, watermark):
+    """Filter out services that haven't been updated since the watermark"""
+    if watermark is None:
+        return iter(services)
+
+    return (service for service in services if service_watermark(service) > watermark)
+
+
+def make_index_name(alias, now=None):
+    """Return a new timestamped index name for `alias`, eg 'g-cloud-2016-05-04-10-30-00'"""
+    return '{}-{}'.format(alias, (now or datetime.utcnow()).strftime('%Y-%m-%d-%H-%M-%S'))
+
+
+def published_pages(pages):
+    """Drop unpublished services, which don't need deleting from a new empty index"""
+    return ((page, [service for service in services if service['status'] == 'published']) for page, services in pages)
+
+
+class ServiceCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, service, ok):
+        self.count += 1
+
+
+def changed_pages_since(pages, watermark):
+    return ((page, list(changed_since(services, watermark))) for page, services in pages)
+
+
+def cap_watermark(watermark, limit):
+    """Move `watermark` back to the `limit` updatedAt if it's later
+
+    Pages aren't fetched in updatedAt order, so a service on an early page can be
+    updated after its page was read but before a later page with newer services.
+    Capping the saved watermark at the start of the run means the next run picks
+    that update up.
+
+    """
+    if watermark is None or watermark[0] < limit:
+        return watermark
+
+    return limit, ''
+
+
+class WatermarkTracker(object):
+    """Track the highest ``(updatedAt, id)`` of successfully indexed services"""
+    def __init__(self, watermark):
+        self.watermark = watermark
+
+    def __call__(self, service, ok):
+        if ok and (self.watermark is None or service_watermark(service) > self.watermark):
+            self.watermark = service_watermark(service)
+
+
+class Checkpointer(object):
+    """Track indexing progress through data API pages and save resumable checkpoints
+
+    A checkpoint records the first page that hasn't been completely indexed, the ids
+    of services on that and later pages that search-api has already acknowledged and
+    the ids that were sent but not acknowledged yet. A resumed run starts fetching from
+    the checkpoint page and skips the acknowledged services.
+
+    Services that fail to index are never acknowledged, so they are sent again on resume.
+
+    `page_step` must match the step between the pages being tracked.
+
+    """
+    def __init__(self, checkpoint_file, page=1, acknowledged=(), interval=1000, page_step=1):
+        self.checkpoint_file = checkpoint_file
+        self.page = page
+        self.page_step = page_step
+        self.acknowledged = set(acknowledged)
+        self.interval = interval
+        self._page_ids = {}
+        self._in_flight = {}
+        self._service_pages = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, checkpoint_file, **kwargs):
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+
+        return cls(checkpoint_file, page=checkpoint['page'], acknowledged=checkpoint['acknowledged'], **kwargs)
+
+    def track(self, pages):
+        """Yield services from data API pages, skipping already acknowledged ones"""
+        for page, services in pages:
+            to_send = [service for service in services if service['id'] not in self.acknowledged]
+            with self._lock:
+                self._page_ids[page] = set(service['id'] for service in services)
+                self._in_flight[page] = set(service['id'] for service in to_send)
+                for service in to_send:
+                    # Pages can shift during a run, so the same service can be on more than one
+                    self._service_pages.setdefault(service['id'], set()).add(page)
+                self._advance()
+
+            for service in to_send:
+                yield service
+
+    def __call__(self, service, ok):
+        if not ok:
+            return
+
+        with self._lock:
+            if service['id'] not in self._service_pages:
+                # Already acknowledged from another page it was on
+                return
+            for page in self._service_pages.pop(service['id']):
+                self._in_flight[page].discard(service['id'])
+            self.acknowledged.add(service['id'])
+            self._advance()
+
+            self._unsaved += 1
+            if self._unsaved >= self.interval:
+                self._save()
+
+    def _advance(self):
+        while self.page in self._in_flight and not self._in_flight[self.page]:
+            self.acknowledged.difference_update(self._page_ids.pop(self.page))
+            del self._in_flight[self.page]
+            self.page += self.page_step
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        checkpoint = {
+            'page': self.page,
+            'acknowledged': sorted(self.acknowledged),
+            'inFlight': sorted(service_id for ids in self._in_flight.values() for service_id in ids),
+        }
+        with open(self.checkpoint_file + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.rename(self.checkpoint_file + '.tmp', self.checkpoint_file)
+
+        self._unsaved = 0
+        logger.info("Saved checkpoint at page {page}", extra={'page': self.page})
+
+    def remove(self):
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+
+def merge_join(left, right):
+    """Join two iterables of ``(key, value)`` pairs sorted by key
+
+    Yields ``(key, left value, right value)`` for every key in either iterable, with
+    None for the value missing from one side. Only one item from each side is held
+    at a time.
+
+    """
+    left, right = iter(left), iter(right)
+    left_item, right_item = next(left, None), next(right, None)
+
+    while left_item is not None or right_item is not None:
+        if right_item is None or (left_item is not None and left_item[0] < right_item[0]):
+            yield left_item[0], left_item[1], None
+            left_item = next(left, None)
+        elif left_item is None or right_item[0] < left_item[0]:
+            yield right_item[0], None, right_item[1]
+            right_item = next(right, None)
+        else:
+            yield left_item[0], left_item[1], right_item[1]
+            left_item, right_item = next(left, None), next(right, None)
+
+
+def find_differences(data_api_services, search_api_documents):
+    """Compare ``(id, service)`` pairs from the data API with ``(id, document)`` pairs from
+    the search index, both sorted by id, and yield ``(difference, id)`` for each service that
+    needs reindexing:
+
+    - 'missing': published in the data API but not in the index
+    - 'stale': the data API copy has been updated since the indexed copy. Indexed documents
+      without an updatedAt aren't considered stale.
+    - 'orphaned': in the index but not published in the data API
+
+    """
+    for service_id, service, document in merge_join(data_api_services, search_api_documents):
+        published = service is not None and service['status'] == 'published'
+        if published and document is None:
+            yield 'missing', service_id
+        elif published and document.get('updatedAt') and service['updatedAt'] > document['updatedAt']:
+            yield 'stale', service_id
+        elif not published and document is not None:
+            yield 'orphaned', service_id
+
+
+def service_keys(services):
+    """Return services as ``(id, {status, updatedAt})`` pairs sorted by id
+
+    Neither the data API nor search-api return services in id order, so they have to be
+    sorted before they can be joined. Only the fields needed for reconciling are kept.
+
+    """
+    return sorted(
+        (six.text_type(service['id']), {'status': service.get('status'), 'updatedAt': service.get('updatedAt')})
+        for service in services
+    )
+
+
+def call_all(*callbacks):
+    callbacks = [callback for callback in callbacks if callback is not None]
+
+    def inner(*args):
+        for callback in callbacks:
+            callback(*args)
+
+    return inner
+
+
+def bounded(iterable, semaphore):
+    """Acquire `semaphore` before yielding each item, to limit how far ahead of the
+    consumer the iterable is read"""
+    for item in iterable:
+        semaphore.acquire()
+        yield item
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def print_progress(counter, start_time, concurrency=None, stats=None):
+    if counter % 100 == 0:
+        time_delta = datetime.utcnow() - start_time
+        extra = {'counter': counter, 'time': time_delta, 'rps': counter / time_delta.total_seconds()}
+        message = "{counter} in {time} ({rps}/s)"
+        if stats is not None:
+            message = "{counter} in {time} ({window_rps}/s over the last {window}s, {rps}/s overall)"
+            extra.update(window_rps=stats.window_rate(), window=stats.window)
+        if concurrency is not None:
+            message += " with {concurrency} workers"
+            extra.update(concurrency=concurrency)
+        logger.info(message, extra=extra)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(fraction * len(ordered))) - 1)]
+
+
+class ConcurrencyController(object):
+    """Adjust the number of concurrent indexer calls with additive increase/multiplicative decrease
+
+    After every `window` calls the controller looks at the p95 call latency and the error
+    rate. While p95 stays within `latency_tolerance` times the best p95 seen so far and
+    the error rate is at most `max_error_rate` one more concurrent call is allowed. As soon
+    as either rises the limit is halved, down to `min_workers`.
+
+    Retries happen inside indexer calls, so a search-api struggling with the load shows
+    up as higher latency before services start failing.
+
+    """
+    def __init__(self, min_workers, max_workers, initial=10, window=20, latency_tolerance=2.0, max_error_rate=0.01):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.limit = max(min_workers, min(max_workers, initial))
+        self.window = window
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.best_latency = None
+        self._active = 0
+        self._latencies = []
+        self._errors = 0
+        self._calls = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self, latency, calls, errors):
+        """Record the outcome of an indexer call
+
+        :param latency: call duration in seconds
+        :param calls: number of services in the call
+        :param errors: number of services that failed to index
+
+        """
+        with self._condition:
+            self._active -= 1
+            self._latencies.append(latency)
+            self._calls += calls
+            self._errors += errors
+            if len(self._latencies) >= self.window:
+                self._adjust()
+            self._condition.notify_all()
+
+    def _adjust(self):
+        p95 = percentile(self._latencies, 0.95)
+        error_rate = float(self._errors) / self._calls if self._calls else 0
+        if self.best_latency is None or p95 < self.best_latency:
+            self.best_latency = p95
+
+        if p95 <= self.best_latency * self.latency_tolerance and error_rate <= self.max_error_rate:
+            self.limit = min(self.max_workers, self.limit + 1)
+        else:
+            self.limit = max(self.min_workers, self.limit // 2)
+            logger.info("Reducing concurrency to {concurrency} (p95 {p95}s, error rate {error_rate})", extra={
+                'concurrency': self.limit, 'p95': p95, 'error_rate': error_rate
+            })
+
+        self._latencies = []
+        self._errors = 0
+        self._calls = 0
+
+    def __call__(self, indexer):
+        """Wrap an indexer so that its calls are limited and measured by this controller"""
+        def inner(services):
+            self.acquire()
+            start = time.time()
+            results = []
+            try:
+                results = indexer(services)
+            finally:
+                self.release(time.time() - start, len(services), sum(1 for service, ok in results if not ok))
+            return results
+
+        return inner
+
+
+def _record_retry(details):
+    indexer = details['args'][0]
+    indexer.stats.increment('retries')
+    indexer.stats.record('retry_wait', details['wait'])
+
+
+def _is_client_error(e):
+    return e.status_code is not None and 400 <= e.status_code < 500
+
+
+class ServiceIndexer(object):
+    """Index or delete each service in a batch with a separate search-api request
+
+    Called with a list of services and returns a list of ``(service, ok)`` pairs.
+
+    Each worker thread gets its own client, created on first use. All clients share
+    one HTTP session keeping up to `pool_size` connections to search-api open, which
+    should be at least the number of worker threads.
+
+    Request timings and retries are recorded in `stats`.
+
+    """
+    def __init__(self, endpoint, access_token, index, pool_size=10, stats=None):
+        self.endpoint = endpoint
+        self.access_token = access_token
+        self.index = index
+        self.session = make_session(pool_size)
+        self.stats = stats or IndexingStats()
+        self._local = threading.local()
+
+    def get_client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = SearchAPIClient(self.endpoint, self.access_token,
+                                                          session=self.session, stats=self.stats)
+
+        return client
+
+    def __call__(self, services):
+        client = self.get_client()
+
+        return [(service, self.try_index_service(client, service)) for service in services]
+
+    def try_index_service(self, client, service):
+        try:
+            self.index_service(client, service)
+            return True
+        except dmapiclient.APIError:
+            logger.exception("{service_id} not indexed", extra={'service_id': service.get('id')})
+            return False
+
+    @backoff.on_exception(backoff.expo, dmapiclient.HTTPError, max_tries=5, on_backoff=_record_retry)
+    def index_service(self, client, service):
+        if service['status'] == 'published':
+            client.index(service['id'], service, index=self.index)
+        else:
+            client.delete(service['id'], index=self.index)
+
+    def wait_for_document_count(self, expected, attempts=5, delay=2):
+        """Return True once search-api reports `expected` documents in the index
+
+        Newly indexed documents only become searchable after the index is refreshed,
+        so the count is checked a few times before giving up.
+
+        """
+        client = self.get_client()
+        for attempt in range(attempts):
+            count = client.count_documents(self.index)
+            if count == expected:
+                return True
+            time.sleep(delay)
+
+        logger.error("{index} has {count} documents, expected {expected}", extra={
+            'index': self.index, 'count': count, 'expected': expected
+        })
+        return False
+
+    def set_alias(self, alias):
+        logger.info("Pointing {alias} alias at {index}", extra={'alias': alias, 'index': self.index})
+        self.get_client().set_alias(alias, self.index)
+
+    def create_index(self):
+        client = self.get_client()
+        logger.info("Creating {index} index", extra={'index': self.index})
+
+        try:
+            result = client.create_index(self.index)
+            logger.info("Index creation response: {response}", extra={'response': result})
+        except dmapiclient.HTTPError as e:
+            if 'already exists as alias' in e.message:
+                logger.info("Skipping index creation for alias {index}", extra={'index': self.index})
+            else:
+                raise
+
+
+class BulkServiceIndexer(ServiceIndexer):
+    """Index or delete a batch of services with a single search-api bulk request
+
+    Failures are reported for each service, so one bad document doesn't fail the
+    rest of the batch. If the whole request fails all services in the batch are
+    reported as not indexed, as are any services the response has no result for.
+
+    """
+    def __call__(self, services):
+        client = self.get_client()
+
+        try:
+            response = self.bulk_index_services(client, services)
+        except dmapiclient.APIError:
+            logger.exception("Batch of {count} services starting with {service_id} not indexed", extra={
+                'count': len(services), 'service_id': services[0].get('id')
+            })
+            return [(service, False) for service in services]
+
+        # Match results by id rather than position, so a service missing from the response
+        # is reported as failed instead of silently dropped
+        results_by_id = dict((six.text_type(result.get('id')), result) for result in response['results'])
+
+        results = []
+        for service in services:
+            result = results_by_id.get(six.text_type(service.get('id')))
+            if result is None:
+                logger.error("{service_id} not indexed: no result in bulk response", extra={
+                    'service_id': service.get('id')
+                })
+                ok = False
+            else:
+                ok = 200 <= result['status'] < 300
+                if not ok:
+                    logger.error("{service_id} not indexed: {status} {error}", extra={
+                        'service_id': service.get('id'), 'status': result['status'], 'error': result.get('error')
+                    })
+            results.append((service, ok))
+
+        return results
+
+    # A 4xx won't go away on retry, eg when search-api doesn't have the bulk endpoint
+    @backoff.on_exception(backoff.expo, dmapiclient.HTTPError, max_tries=5, on_backoff=_record_retry,
+                          giveup=_is_client_error)
+    def bulk_index_services(self, client, services):
+        return client.bulk([self.make_operation(service) for service in services], index=self.index)
+
+    @staticmethod
+    def make_operation(service):
+        if service['status'] == 'published':
+            return {'action': 'index', 'id': service['id'], 'service': service}
+        else:
+            return {'action': 'delete', 'id': service['id']}
+
+
+def make_indexer(search_api_url, search_api_access_token, index, batch_size=None, pool_size=10, stats=None):
+    if batch_size:
+        return BulkServiceIndexer(search_api_url, search_api_access_token, index, pool_size, stats)
+    else:
+        return ServiceIndexer(search_api_url, search_api_access_token, index, pool_size, stats)
+
+
+def timed(indexer, stats):
+    def inner(services):
+        with stats.time('indexer_call'):
+            return indexer(services)
+
+    return inner
+
+
+def index_services(indexer, services, serial=False, batch_size=None, on_result=None, max_in_flight=None,
+                   workers=10, controller=None, stats=None):
+    """Send services to the indexer and return True if all of them were indexed
+
+    :param batch_size: number of services passed to each indexer call. Services are
+                       sent one at a time if not set.
+    :param on_result: optional callable called with ``(service, ok)`` for each
+                      indexed service
+    :param max_in_flight: maximum number of batches queued for or being processed by
+                          the indexer. The thread pool reads all of `services` as fast
+                          as it can if not set.
+    :param workers: number of concurrent indexer calls
+    :param controller: a ConcurrencyController adjusting the number of concurrent
+                       indexer calls instead of using a fixed number of workers
+    :param stats: IndexingStats to record indexer call timings and indexed services in
+
+    """
+    stats = stats or IndexingStats()
+    indexer = timed(indexer, stats)
+
+    if serial:
+        pool = None
+        mapper = map
+    elif controller is not None:
+        pool = ThreadPool(controller.max_workers)
+        mapper = pool.imap_unordered
+        indexer = controller(indexer)
+    else:
+        pool = ThreadPool(workers)
+        mapper = pool.imap_unordered
+
+    counter = 0
+    start_time = datetime.utcnow()
+    status = True
+
+    batches = batched(services, batch_size or 1)
+    in_flight = None
+    if max_in_flight:
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        batches = bounded(batches, in_flight)
+
+    for results in mapper(indexer, batches):
+        if in_flight is not None:
+            in_flight.release()
+        for service, result in results:
+            counter += 1
+            status = status and result
+            stats.services_indexed()
+            if not result:
+                stats.increment('failed')
+            if on_result is not None:
+                on_result(service, result)
+            print_progress(counter, start_time, controller.limit if controller is not None else None, stats)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    return status
+
+
+def do_index(search_api_url, search_api_access_token, data_api_url, data_api_access_token, serial, index, frameworks,
+             batch_size=None, state_file=None, pool_size=None, checkpoint_file=None, resume=False, alias=None,
+             prefetch=2, max_buffered_services=10000, min_workers=10, max_workers=10, stats_file=None,
+             shard=None, create_index=True):
+    """Index services from the data API into search-api
+
+    :param state_file: path to an incremental reindex state file. If set, only services
+                       updated since the watermark saved by the last successful run are
+                       indexed, and the watermark is moved forward if every service was
+                       indexed successfully. It is never moved past the start of the run,
+                       less WATERMARK_SAFETY_MARGIN.
+    :param pool_size: number of search-api connections kept open for reuse, `max_workers`
+                      by default so that every concurrent indexer call can reuse one
+    :param checkpoint_file: path to periodically save progress to. The checkpoint is
+                            removed once every service has been indexed.
+    :param resume: continue from the last checkpoint saved in `checkpoint_file`
+    :param alias: build a new timestamped index for this alias instead of updating
+                  `index` in place. Only published services are sent, and the alias is
+                  switched to the new index once its document count matches the number
+                  of published services in the data API.
+    :param prefetch: number of data API pages to fetch ahead of the indexer
+    :param max_buffered_services: maximum number of services held in prefetched pages,
+                                  and separately in batches waiting for the indexer
+    :param min_workers: lower bound for the number of concurrent indexer calls
+    :param max_workers: upper bound for the number of concurrent indexer calls. If it's
+                        higher than `min_workers` concurrency is adjusted to search-api
+                        latency and error rate while indexing.
+    :param stats_file: path to write a JSON summary of stage timings and rates to
+    :param shard: ``(shard number, shard count)`` to only index every shard count-th page
+                  of services, starting from page shard number + 1
+    :param create_index: set to False if the index has already been created
+
+    """
+    logger.info("Search API URL: {search_api_url}", extra={'search_api_url': search_api_url})
+    logger.info("Data API URL: {data_api_url}", extra={'data_api_url': data_api_url})
+
+    if alias is not None:
+        index = make_index_name(alias)
+
+    stats = IndexingStats()
+    indexer = make_indexer(search_api_url, search_api_access_token, index, batch_size, pool_size or max_workers,
+                           stats)
+    if create_index:
+        indexer.create_index()
+
+    first_page, page_step = (shard[0] + 1, shard[1]) if shard else (1, 1)
+    watermark_limit = (datetime.utcnow() - WATERMARK_SAFETY_MARGIN).strftime(DATETIME_FORMAT)
+
+    checkpointer = None
+    if checkpoint_file is not None:
+        if resume and os.path.exists(checkpoint_file):
+            checkpointer = Checkpointer.load(checkpoint_file, page_step=page_step)
+            logger.info("Resuming from page {page} with {count} services already indexed", extra={
+                'page': checkpointer.page, 'count': len(checkpointer.acknowledged)
+            })
+        else:
+            checkpointer = Checkpointer(checkpoint_file, page=first_page, page_step=page_step)
+
+    pages = request_service_pages(data_api_url, data_api_access_token, frameworks,
+                                  start_page=checkpointer.page if checkpointer else first_page,
+                                  stats=stats, page_step=page_step)
+    if prefetch:
+        pages = prefetch_pages(pages, prefetch, max_buffered_services)
+
+    tracker = None
+    if state_file is not None:
+        watermark = load_watermark(state_file)
+        logger.info("Indexing services updated since {watermark}", extra={'watermark': watermark})
+        tracker = WatermarkTracker(watermark)
+        pages = changed_pages_since(pages, watermark)
+
+    counter = None
+    if alias is not None:
+        counter = ServiceCounter()
+        pages = published_pages(pages)
+
+    services = checkpointer.track(pages) if checkpointer else flatten_pages(pages)
+
+    controller = None
+    if not serial and max_workers > min_workers:
+        controller = ConcurrencyController(min_workers, max_workers)
+
+    status = index_services(indexer, services, serial, batch_size,
+                            on_result=call_all(tracker, checkpointer, counter),
+                            max_in_flight=max(1, max_buffered_services // (batch_size or 1)),
+                            workers=max_workers, controller=controller, stats=stats)
+
+    if alias is not None:
+        if status and indexer.wait_for_document_count(counter.count):
+            indexer.set_alias(alias)
+        else:
+            logger.error("Not pointing {alias} alias at incomplete index {index}", extra={
+                'alias': alias, 'index': index
+            })
+            status = False
+
+    new_watermark = cap_watermark(tracker.watermark, watermark_limit) if tracker is not None else None
+    if tracker is not None and status and new_watermark != watermark:
+        save_watermark(state_file, new_watermark)
+        logger.info("Saved watermark {watermark}", extra={'watermark': new_watermark})
+
+    if checkpointer is not None:
+        if status:
+            checkpointer.remove()
+        else:
+            checkpointer.save()
+
+    if stats_file is not None:
+        stats.write_summary(stats_file, status=status, index=index)
+
+    return status
+
+
+def do_reconcile(search_api_url, search_api_access_token, data_api_url, data_api_access_token, serial, index,
+                 frameworks, batch_size=None, pool_size=None, workers=10):
+    """Index missing and stale services and delete orphaned documents
+
+    Compares the services in the data API with the documents in the search index and
+    only sends the differences to search-api.
+
+    """
+    logger.info("Search API URL: {search_api_url}", extra={'search_api_url': search_api_url})
+    logger.info("Data API URL: {data_api_url}", extra={'data_api_url': data_api_url})
+
+    data_client = dmapiclient.DataAPIClient(data_api_url, data_api_access_token)
+    indexer = make_indexer(search_api_url, search_api_access_token, index, batch_size, pool_size or workers)
+
+    data_api_services = service_keys(
+        flatten_pages(request_service_pages(data_api_url, data_api_access_token, frameworks))
+    )
+    search_api_documents = service_keys(indexer.get_client().iter_documents(index))
+    if frameworks:
+        # The index holds every framework, so only documents for services that exist on the chosen
+        # frameworks can be compared
+        data_api_ids = set(service_id for service_id, service in data_api_services)
+        search_api_documents = [
+            (service_id, document) for service_id, document in search_api_documents if service_id in data_api_ids
+        ]
+
+    summary = {'missing': 0, 'stale': 0, 'orphaned': 0}
+
+    def services_to_reindex():
+        for difference, service_id in find_differences(data_api_services, search_api_documents):
+            summary[difference] += 1
+            if difference == 'orphaned':
+                # Any non-published status makes the indexer delete the document
+                yield {'id': service_id, 'status': 'deleted'}
+            else:
+                yield data_client.get_service(service_id)['services']
+
+    status = index_services(indexer, services_to_reindex(), serial, batch_size, workers=workers)
+
+    logger.info("Reconciled {index}: {missing} missing, {stale} stale, {orphaned} orphaned", extra=dict(
+        summary, index=index
+    ))
+
+    return status
+
+
+def make_shards(frameworks, shard_by, shard_count):
+    """Split an indexing run into shards, returning a ``(name, do_index arguments)`` pair for each
+
+    :param shard_by: 'framework' for one shard per framework in the comma-separated
+                     `frameworks`, or 'page' for `shard_count` shards each indexing every
+                     `shard_count`th page of services
+
+    """
+    if shard_by == 'framework':
+        return [(framework, {'frameworks': framework}) for framework in frameworks.split(',')]
+    elif shard_by == 'page':
+        return [
+            ('page-{}-of-{}'.format(number + 1, shard_count),
+             {'frameworks': frameworks, 'shard': (number, shard_count)})
+            for number in range(shard_count)
+        ]
+    else:
+        raise ValueError("Unknown shard type: {}".format(shard_by))
+
+
+def _shard_path(path, shard_name):
+    return '{}.{}'.format(path, shard_name) if path else path
+
+
+def _index_shard(shard):
+    name, arguments = shard
+    try:
+        return name, do_index(**arguments)
+    except Exception:
+        logger.exception("Shard {shard} failed", extra={'shard': name})
+        return name, False
+
+
+def do_sharded_index(search_api_url, search_api_access_token, index, frameworks, shard_by, shard_count=None,
+                     **kwargs):
+    """Run do_index in a separate worker process for each shard
+
+    Each process has its own pool of indexer threads. The index is created once before
+    the shards start, and state, checkpoint and stats files get the shard name appended.
+
+    Returns True if every shard indexed all of its services.
+
+    """
+    shards = make_shards(frameworks, shard_by, shard_count)
+    make_indexer(search_api_url, search_api_access_token, index).create_index()
+
+    shard_arguments = [
+        (name, dict(
+            kwargs,
+            search_api_url=search_api_url,
+            search_api_access_token=search_api_access_token,
+            index=index,
+            create_index=False,
+            state_file=_shard_path(kwargs.get('state_file'), name),
+            checkpoint_file=_shard_path(kwargs.get('checkpoint_file'), name),
+            stats_file=_shard_path(kwargs.get('stats_file'), name),
+            **shard_arguments
+        ))
+        for name, shard_arguments in shards
+    ]
+
+    pool = multiprocessing.Pool(len(shards))
+    try:
+        results = pool.map(_index_shard, shard_arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+    for name, ok in results:
+        logger.info("Shard {shard} {result}", extra={'shard': name, 'result': 'succeeded' if ok else 'failed'})
+
+    return all(ok for name, ok in results)
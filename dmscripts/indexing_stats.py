@@ -0,0 +1,102 @@
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+class Histogram(object):
+    """Count durations into fixed buckets, in seconds"""
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        labels = ['<={}'.format(bucket) for bucket in self.BUCKETS] + ['>{}'.format(self.BUCKETS[-1])]
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class IndexingStats(object):
+    """Thread-safe timings and counters for each stage of an indexing run
+
+    Durations are recorded into a histogram per stage, eg 'data_api_page_fetch',
+    'serialise', 'search_api_request' and 'retry_wait'. Indexed services are also
+    counted per second, so the recent indexing rate can be reported alongside the
+    average for the whole run.
+
+    """
+    def __init__(self, window=60, clock=time.time):
+        self.window = window
+        self.clock = clock
+        self.start_time = clock()
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+        self._per_second = deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(stage, self.clock() - start)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].add(seconds)
+
+    def increment(self, counter, count=1):
+        with self._lock:
+            self.counters[counter] += count
+
+    def services_indexed(self, count=1):
+        now = int(self.clock())
+        with self._lock:
+            self.counters['services'] += count
+            if self._per_second and self._per_second[-1][0] == now:
+                self._per_second[-1][1] += count
+            else:
+                self._per_second.append([now, count])
+            while self._per_second[0][0] <= now - self.window:
+                self._per_second.popleft()
+
+    def window_rate(self):
+        """Services indexed per second over the last `window` seconds"""
+        now = self.clock()
+        with self._lock:
+            count = sum(count for second, count in self._per_second if second > now - self.window)
+        elapsed = min(self.window, now - self.start_time)
+
+        return count / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        elapsed = self.clock() - self.start_time
+        with self._lock:
+            return {
+                'elapsed': elapsed,
+                'rate': self.counters.get('services', 0) / elapsed if elapsed > 0 else 0.0,
+                'counters': dict(self.counters),
+                'stages': {stage: histogram.to_dict() for stage, histogram in self.histograms.items()},
+            }
+
+    def write_summary(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(dict(self.summary(), **extra), f, indent=2, sort_keys=True)
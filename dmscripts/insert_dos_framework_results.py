@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+from collections import namedtuple
+
 from dmapiclient import HTTPError
 
 CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 15, 16, 38, 39, 40, 41, 42,
@@ -19,6 +21,85 @@ FAIL = "Fail"
 PASS = "Pass"
 DISCRETIONARY = "Discretionary"
 
+# Kinds of declaration question rule
+MUST_BE_TRUE = 'must-be-true'
+MUST_BE_FALSE = 'must-be-false'
+SHOULD_BE_FALSE = 'should-be-false'
+ONE_OF = 'one-of'
+MITIGATING = 'mitigating'
+MANDATORY_RULES = (MUST_BE_TRUE, MUST_BE_FALSE, ONE_OF)
+DISCRETIONARY_RULES = (SHOULD_BE_FALSE, MITIGATING)
+RULE_MESSAGES = {
+    MUST_BE_TRUE: " Question {} must be True but is {}",
+    MUST_BE_FALSE: " Question {} must be False but is {}",
+    SHOULD_BE_FALSE: " Question {} should be False but is {}",
+    ONE_OF: " Question {} has the wrong answer: {}",
+}
+
+DeclarationRule = namedtuple('DeclarationRule', ['number', 'kind', 'allowed'])
+
+
+def _rules_by_number():
+    rules = {}
+    for kind, numbers, allowed in [
+        (MUST_BE_TRUE, CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE, (True,)),
+        (MUST_BE_FALSE, CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE, (False,)),
+        (SHOULD_BE_FALSE, CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE, (False,)),
+        (MITIGATING, MITIGATING_FACTORS, None),
+    ]:
+        rules.update((number, DeclarationRule(number, kind, allowed)) for number in numbers)
+    for number, responses in CORRECT_DECLARATION_RESPONSES.items():
+        rules[number] = DeclarationRule(number, ONE_OF, tuple(responses))
+
+    return rules
+
+
+DECLARATION_RULES = _rules_by_number()
+
+
+class DeclarationRules(object):
+    """The rule for each question in a declaration manifest, looked up by question id
+
+    Each question's rule is worked out from the manifest once and then kept, so the
+    same DeclarationRules can be used to check every supplier's declaration.
+
+    """
+    def __init__(self, declaration_content):
+        self.declaration_content = declaration_content
+        self._rules = {}
+        self._questions = None
+
+    def get(self, question_id):
+        """Return the DeclarationRule for `question_id`, or None if it isn't a question with a rule"""
+        if question_id not in self._rules:
+            question = self.declaration_content.get_question(question_id)
+            self._rules[question_id] = DECLARATION_RULES.get(question.number) if question else None
+
+        return self._rules[question_id]
+
+    def questions(self):
+        """Return (question id, DeclarationRule) for each question with a rule, in manifest order"""
+        if self._questions is None:
+            self._questions = [
+                (question.id, DECLARATION_RULES[question.number])
+                for section in self.declaration_content
+                for question in section.questions
+                if question.number in DECLARATION_RULES
+            ]
+            self._rules.update(self._questions)
+
+        return self._questions
+
+
+def is_allowed_answer(rule, answer):
+    if rule.allowed is None:
+        return True
+    if rule.kind == ONE_OF:
+        return answer in rule.allowed
+
+    # Yes/no answers have to be the booleans themselves, not just equal to them
+    return answer is rule.allowed[0]
+
 
 def insert_result(client, supplier_id, result, user):
     try:
@@ -42,34 +123,23 @@ def check_service_essentials(draft):
     return PASS
 
 
-def check_declaration_answers(declaration_content, declaration):
+def check_declaration_answers(declaration_content, declaration, declaration_rules=None):
     if declaration['status'] != 'complete':
         return FAIL
 
-    result = PASS
-    for (field_name) in declaration:
-        question_number = declaration_content.get_question(field_name).number \
-            if declaration_content.get_question(field_name) else -1
-        if (question_number in CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE
-           and declaration[field_name] is not True):
-            print(" Question {} must be True but is {}".format(question_number, declaration[field_name]))
-            result = FAIL
-
-        if (question_number in CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE
-           and declaration[field_name] is not False):
-            print(" Question {} must be False but is {}".format(question_number, declaration[field_name]))
-            result = FAIL
+    declaration_rules = declaration_rules or DeclarationRules(declaration_content)
 
-        if (question_number in CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE
-           and declaration[field_name] is not False):
-            print(" Question {} should be False but is {}".format(question_number, declaration[field_name]))
-            if result == PASS:
-                result = DISCRETIONARY
+    result = PASS
+    for field_name, answer in declaration.items():
+        rule = declaration_rules.get(field_name)
+        if rule is None or is_allowed_answer(rule, answer):
+            continue
 
-        if (question_number in CORRECT_DECLARATION_RESPONSES
-           and declaration[field_name] not in CORRECT_DECLARATION_RESPONSES[question_number]):
-            print(" Question {} has the wrong answer: {}".format(question_number, declaration[field_name]))
+        print(RULE_MESSAGES[rule.kind].format(rule.number, answer))
+        if rule.kind in MANDATORY_RULES:
             result = FAIL
+        elif result == PASS:
+            result = DISCRETIONARY
 
     return result
 
@@ -93,6 +163,7 @@ def process_submitted_drafts(client, supplier_id, user):
 def process_dos_results(client, content_loader, user):
     content_loader.load_manifest('digital-outcomes-and-specialists', 'declaration', 'declaration')
     declaration_content = content_loader.get_manifest('digital-outcomes-and-specialists', 'declaration')
+    declaration_rules = DeclarationRules(declaration_content)
 
     dos_registered_suppliers = client\
         .get_interested_suppliers('digital-outcomes-and-specialists')\
@@ -102,7 +173,9 @@ def process_dos_results(client, content_loader, user):
         print("SUPPLIER: {}".format(supplier_id))
         declaration = client.get_supplier_declaration(supplier_id, 'digital-outcomes-and-specialists')['declaration']
 
-        declaration_result = check_declaration_answers(declaration_content, declaration) if declaration else FAIL
+        declaration_result = FAIL
+        if declaration:
+            declaration_result = check_declaration_answers(declaration_content, declaration, declaration_rules)
         supplier_has_submitted_services = process_submitted_drafts(client, supplier_id, user)
 
         if declaration_result == PASS and supplier_has_submitted_services:
@@ -0,0 +1,64 @@
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from six.moves import filter
+
+
+def _ordered_map(pool, function, records, max_in_flight):
+    """Yield `function(record)` for each record in order, with at most `max_in_flight` calls queued or running
+
+    Records are only taken from `records` as results are taken from this generator,
+    so a slow later stage holds back earlier ones rather than letting results pile up.
+
+    """
+    pending = deque()
+    for record in records:
+        pending.append(pool.apply_async(function, (record,)))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+class Pipeline(object):
+    """A chain of stages that records pass through in order
+
+    Each map stage has its own pool of `workers` threads, so a stage can't be starved
+    of threads by the others, and a bounded number of records in flight. Records come
+    out in the same order they went in. The thread pools only exist while `run` is
+    being iterated over and are shut down when it finishes, fails or is closed, eg::
+
+        pipeline = Pipeline().map(add_supplier_info(client), workers=10).filter(is_on_framework)
+        for record in pipeline.run(find_suppliers(client, framework_slug)):
+            write_row(record)
+
+    """
+    def __init__(self):
+        self.stages = []
+
+    def map(self, function, workers=10, max_in_flight=None):
+        self.stages.append(('map', function, workers, max_in_flight or workers * 2))
+        return self
+
+    def filter(self, predicate):
+        self.stages.append(('filter', predicate, None, None))
+        return self
+
+    def run(self, records):
+        pools = []
+        try:
+            for kind, function, workers, max_in_flight in self.stages:
+                if kind == 'filter':
+                    records = filter(function, records)
+                else:
+                    pool = ThreadPool(workers)
+                    pools.append(pool)
+                    records = _ordered_map(pool, function, records, max_in_flight)
+
+            for record in records:
+                yield record
+        finally:
+            for pool in pools:
+                pool.terminate()
+                pool.join()
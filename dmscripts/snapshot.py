@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+
+import six
+from dmapiclient import DataAPIClient
+
+from dmscripts.pipeline import Pipeline
+
+
+SCHEMA = "CREATE TABLE snapshot (kind TEXT, key TEXT, data TEXT, PRIMARY KEY (kind, key))"
+
+
+def _supplier_framework_key(supplier_id, framework_slug):
+    return u'{}/{}'.format(supplier_id, framework_slug)
+
+
+def fetch_supplier(client, framework_slug):
+    def inner(supplier_id):
+        return (
+            supplier_id,
+            client.get_supplier(supplier_id),
+            client.get_supplier_framework_info(supplier_id, framework_slug),
+            list(client.find_draft_services_iter(supplier_id, framework=framework_slug)),
+        )
+
+    return inner
+
+
+def take_snapshot(client, framework_slug, snapshot_file, workers=10):
+    """Save the interested suppliers for a framework to an SQLite file, with their details,
+    framework interest (including their declaration) and draft services
+
+    The snapshot is written to a temporary file and only replaces `snapshot_file` once
+    it is complete. Returns the number of suppliers saved.
+
+    """
+    temporary_file = snapshot_file + '.tmp'
+    if os.path.exists(temporary_file):
+        os.remove(temporary_file)
+
+    connection = sqlite3.connect(temporary_file)
+    try:
+        connection.execute(SCHEMA)
+
+        supplier_ids = client.get_interested_suppliers(framework_slug)['interestedSuppliers']
+        rows = [('interested_suppliers', framework_slug, json.dumps(supplier_ids))]
+
+        records = Pipeline().map(fetch_supplier(client, framework_slug), workers=workers).run(supplier_ids)
+        for supplier_id, supplier, supplier_framework, drafts in records:
+            rows.extend([
+                ('supplier', six.text_type(supplier_id), json.dumps(supplier)),
+                ('supplier_framework', _supplier_framework_key(supplier_id, framework_slug),
+                 json.dumps(supplier_framework)),
+                ('draft_services', _supplier_framework_key(supplier_id, framework_slug), json.dumps(drafts)),
+            ])
+
+        connection.executemany("INSERT INTO snapshot VALUES (?, ?, ?)", rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.rename(temporary_file, snapshot_file)
+    return len(supplier_ids)
+
+
+class SnapshotClient(object):
+    """Answer the DataAPIClient calls made by the export scripts from a snapshot file
+
+    Only the read methods used to export framework data are available, so anything
+    else fails rather than quietly going to the API. Looking up anything that isn't
+    in the snapshot raises a KeyError.
+
+    """
+    def __init__(self, snapshot_file):
+        if not os.path.exists(snapshot_file):
+            raise IOError("Snapshot file {} does not exist".format(snapshot_file))
+
+        # Export pipelines call the client from several threads
+        self._connection = sqlite3.connect(snapshot_file, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _get(self, kind, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM snapshot WHERE kind = ? AND key = ?", (kind, six.text_type(key))
+            ).fetchone()
+
+        if row is None:
+            raise KeyError("{} {} is not in the snapshot".format(kind, key))
+
+        return json.loads(row[0])
+
+    def get_interested_suppliers(self, framework_slug):
+        return {'interestedSuppliers': self._get('interested_suppliers', framework_slug)}
+
+    def get_supplier(self, supplier_id):
+        return self._get('supplier', supplier_id)
+
+    def get_supplier_framework_info(self, supplier_id, framework_slug):
+        return self._get('supplier_framework', _supplier_framework_key(supplier_id, framework_slug))
+
+    def find_draft_services(self, supplier_id, framework=None):
+        return {'services': self._get('draft_services', _supplier_framework_key(supplier_id, framework))}
+
+    def find_draft_services_iter(self, supplier_id, framework=None):
+        for draft in self.find_draft_services(supplier_id, framework)['services']:
+            yield draft
+
+    def close(self):
+        self._connection.close()
+
+
+def get_data_client(api_url, api_token, snapshot_file=None):
+    """Return a client reading from `snapshot_file` if one is given, otherwise from the data API"""
+    if snapshot_file:
+        return SnapshotClient(snapshot_file)
+
+    return DataAPIClient(api_url, api_token)
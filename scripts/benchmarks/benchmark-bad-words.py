@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Benchmark bad words matching against a synthetic corpus.
+
+Generates --services services with a handful of text fields and a list of --words
+bad words, then scans every field value with the single-pass matcher. The old
+approach of one regular expression search per word per value is timed on the
+first --baseline-services services and extrapolated to the whole corpus, as it is
+too slow to run in full.
+
+With --processes the corpus is also scanned through scan_for_bad_words with each
+number of worker processes, to compare throughput as processes are added.
+
+Usage:
+    scripts/benchmarks/benchmark-bad-words.py [options]
+
+Options:
+    --services=<count>           Number of synthetic services to scan [default: 50000]
+    --words=<count>              Number of bad words [default: 2000]
+    --baseline-services=<count>  Number of services to scan with one search per word [default: 20]
+    --seed=<seed>                Random seed for the synthetic corpus [default: 1]
+    --processes=<counts>         Comma-separated numbers of scan worker processes to compare
+"""
+import random
+import re
+import string
+import sys
+import time
+
+from docopt import docopt
+
+sys.path.insert(0, '.')
+from dmscripts.bad_words import BadWordsMatcher, get_field_values, scan_for_bad_words
+
+
+def make_words(rng, count):
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def make_text(rng, vocabulary, length):
+    return ' '.join(rng.choice(vocabulary) for _ in range(length))
+
+
+# Punctuation and symbols that turn up in real service descriptions
+NON_ASCII_WORDS = [u'supplier\u2019s', u'\xa3500', u'\u2013', u'caf\xe9']
+
+
+def make_services(rng, count, bad_words):
+    # Mostly ordinary words, with roughly one bad word in every 500 and one word in 20 with
+    # non-ASCII characters
+    vocabulary = make_words(rng, 5000) * 500 + bad_words + NON_ASCII_WORDS * 31250
+    return [
+        {
+            'id': str(5000000000000000 + i),
+            'serviceName': make_text(rng, vocabulary, 5),
+            'serviceSummary': make_text(rng, vocabulary, 50),
+            'serviceFeatures': [make_text(rng, vocabulary, 10) for _ in range(5)],
+            'serviceBenefits': [make_text(rng, vocabulary, 10) for _ in range(5)],
+        }
+        for i in range(count)
+    ]
+
+
+def scan_with_matcher(services, bad_words):
+    matcher = BadWordsMatcher(bad_words)
+    return sum(
+        len(matcher.find(value)) for service in services for key, value in get_field_values(service)
+    )
+
+
+def scan_per_word(services, bad_words):
+    return sum(
+        1 for service in services for key, value in get_field_values(service) for word in bad_words
+        if re.search(r"\b{}\b".format(word), value, re.IGNORECASE)
+    )
+
+
+def scan_with_processes(processes):
+    def scan(services, bad_words):
+        supplier = {'supplierId': 1, 'frameworkSlug': 'g-cloud-8'}
+        return sum(1 for row in scan_for_bad_words(
+            ((supplier, service) for service in services), bad_words, processes=processes
+        ))
+
+    return scan
+
+
+def timed(scan, services, bad_words):
+    start = time.time()
+    matches = scan(services, bad_words)
+    return matches, time.time() - start
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    rng = random.Random(int(arguments['--seed']))
+    bad_words = make_words(rng, int(arguments['--words']))
+    services = make_services(rng, int(arguments['--services']), bad_words)
+    baseline_services = services[:int(arguments['--baseline-services'])]
+
+    matcher_matches, matcher_elapsed = timed(scan_with_matcher, services, bad_words)
+    baseline_matches, baseline_elapsed = timed(scan_per_word, baseline_services, bad_words)
+    baseline_estimate = baseline_elapsed * len(services) / len(baseline_services)
+
+    print("{} services, {} words".format(len(services), len(bad_words)))
+    print("{:>20} {:>10} {:>12} {:>10}".format('approach', 'seconds', 'services/s', 'matches'))
+    print("{:>20} {:>10.2f} {:>12.1f} {:>10}".format(
+        'single pass', matcher_elapsed, len(services) / matcher_elapsed, matcher_matches))
+    print("{:>20} {:>10.2f} {:>12.1f} {:>10}".format(
+        'search per word*', baseline_estimate, len(baseline_services) / baseline_elapsed, '-'))
+    print("* extrapolated from {} services".format(len(baseline_services)))
+
+    if arguments['--processes']:
+        print("")
+        print("{:>20} {:>10} {:>12} {:>10}".format('processes', 'seconds', 'services/s', 'rows'))
+        for processes in [int(count) for count in arguments['--processes'].split(',')]:
+            rows, elapsed = timed(scan_with_processes(processes), services, bad_words)
+            print("{:>20} {:>10.2f} {:>12.1f} {:>10}".format(processes, elapsed, len(services) / elapsed, rows))
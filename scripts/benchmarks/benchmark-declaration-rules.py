@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""Benchmark checking declarations against the declaration question rules.
+
+Generates --declarations synthetic DOS declarations and a manifest with one
+question for each numbered rule. Like the content loader's manifest, the fake
+manifest finds a question by searching every section.
+
+Each declaration is checked twice with the old approach: once the way
+check_declaration_answers used to (two manifest lookups per field and list
+membership tests), and once the way add_failed_questions used to (a walk over the
+manifest and list membership tests per question). Then the same two checks run
+against a DeclarationRules table built once for the manifest.
+
+Usage:
+    scripts/benchmarks/benchmark-declaration-rules.py [options]
+
+Options:
+    --declarations=<count>  Number of synthetic declarations [default: 10000]
+    --seed=<seed>           Random seed for the synthetic declarations [default: 1]
+"""
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+
+from docopt import docopt
+
+sys.path.insert(0, '.')
+from dmscripts.export_dos_suppliers import add_failed_questions
+from dmscripts.insert_dos_framework_results import (
+    CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE, CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE,
+    CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE, MITIGATING_FACTORS, CORRECT_DECLARATION_RESPONSES,
+    DISCRETIONARY, FAIL, PASS, DeclarationRules, check_declaration_answers
+)
+
+Question = namedtuple('Question', ['id', 'number'])
+Section = namedtuple('Section', ['questions'])
+
+
+class Manifest(object):
+    def __init__(self, sections):
+        self.sections = sections
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def get_question(self, question_id):
+        for section in self.sections:
+            for question in section.questions:
+                if question.id == question_id:
+                    return question
+
+
+def make_manifest():
+    numbers = list(range(1, 55))
+    return Manifest([
+        Section([Question('question{}'.format(number), number) for number in numbers[start:start + 6]])
+        for start in range(0, len(numbers), 6)
+    ])
+
+
+def make_declaration(rng):
+    declaration = {'status': 'complete', 'nameOfOrganisation': 'Supplier'}
+    for number in range(1, 55):
+        if number in CORRECT_DECLARATION_RESPONSES:
+            answer = rng.choice(CORRECT_DECLARATION_RESPONSES[number] + ['No'])
+        elif number in MITIGATING_FACTORS:
+            answer = 'Mitigating factors'
+        else:
+            # Mostly the correct answer, sometimes the wrong one
+            answer = (number in CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE) != (rng.random() < 0.02)
+        declaration['question{}'.format(number)] = answer
+
+    return declaration
+
+
+def old_check_declaration_answers(declaration_content, declaration):
+    result = PASS
+    for field_name in declaration:
+        question_number = declaration_content.get_question(field_name).number \
+            if declaration_content.get_question(field_name) else -1
+        if question_number in CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE and declaration[field_name] is not True:
+            result = FAIL
+        if question_number in CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE and declaration[field_name] is not False:
+            result = FAIL
+        if question_number in CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE and declaration[field_name] is not False:
+            if result == PASS:
+                result = DISCRETIONARY
+        if (question_number in CORRECT_DECLARATION_RESPONSES
+           and declaration[field_name] not in CORRECT_DECLARATION_RESPONSES[question_number]):
+            result = FAIL
+
+    return result
+
+
+def old_is_incorrect_mandatory_question(question, answer):
+    if question.number in CORRECT_DECLARATION_RESPONSE_MUST_BE_TRUE and answer is not True:
+        return True
+    if question.number in CORRECT_DECLARATION_RESPONSE_MUST_BE_FALSE and answer is not False:
+        return True
+    if question.number in CORRECT_DECLARATION_RESPONSES:
+        if answer not in CORRECT_DECLARATION_RESPONSES[question.number]:
+            return True
+
+    return False
+
+
+def old_failed_questions(declaration_content, declaration):
+    declaration_questions = [
+        (question, declaration.get(question.id))
+        for section in declaration_content
+        for question in section.questions
+    ]
+    failed_mandatory = [
+        "Q{}".format(question.number)
+        for question, answer in declaration_questions
+        if old_is_incorrect_mandatory_question(question, answer)
+    ]
+    discretionary = [
+        ("Q{}".format(question.number), answer)
+        for question, answer in declaration_questions
+        if question.number in CORRECT_DECLARATION_RESPONSE_SHOULD_BE_FALSE + MITIGATING_FACTORS
+    ]
+    return failed_mandatory, discretionary
+
+
+def run_old(manifest, declarations):
+    return [
+        (old_check_declaration_answers(manifest, declaration), old_failed_questions(manifest, declaration))
+        for declaration in declarations
+    ]
+
+
+def run_rules(manifest, declarations):
+    declaration_rules = DeclarationRules(manifest)
+    failed_questions_adder = add_failed_questions(manifest)
+
+    results = []
+    for declaration in declarations:
+        record = failed_questions_adder({'declaration': declaration})
+        results.append((
+            check_declaration_answers(manifest, declaration, declaration_rules),
+            (record['failed_mandatory'], record['discretionary']),
+        ))
+    return results
+
+
+def timed(run, manifest, declarations):
+    # check_declaration_answers prints each wrong answer
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        start = time.time()
+        results = run(manifest, declarations)
+        return results, time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    rng = random.Random(int(arguments['--seed']))
+    manifest = make_manifest()
+    declarations = [make_declaration(rng) for _ in range(int(arguments['--declarations']))]
+
+    old_results, old_elapsed = timed(run_old, manifest, declarations)
+    rules_results, rules_elapsed = timed(run_rules, manifest, declarations)
+    assert old_results == rules_results, "Rule table results differ from the old checks"
+
+    print("{} declarations".format(len(declarations)))
+    print("{:>20} {:>10} {:>16}".format('approach', 'seconds', 'declarations/s'))
+    print("{:>20} {:>10.2f} {:>16.1f}".format('lists and lookups', old_elapsed, len(declarations) / old_elapsed))
+    print("{:>20} {:>10.2f} {:>16.1f}".format('rule table', rules_elapsed, len(declarations) / rules_elapsed))
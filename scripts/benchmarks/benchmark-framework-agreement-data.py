@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Benchmark looking up lot counts when generating framework agreement data.
+
+Generates --suppliers synthetic declaration and lot count rows and looks up the
+lot counts for every declaration, first by scanning the lots list for each one
+(as build_framework_agreements used to) and then with the index built by
+index_lot_counts. It then times a whole build_framework_agreements run against a
+fake API client, writing to a temporary directory.
+
+Usage:
+    scripts/benchmarks/benchmark-framework-agreement-data.py [options]
+
+Options:
+    --suppliers=<count>  Number of synthetic suppliers [default: 20000]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+from docopt import docopt
+
+sys.path.insert(0, '.')
+from dmscripts.generate_framework_agreement_data import (
+    build_framework_agreements, index_lot_counts, lot_counts_for_supplier_id
+)
+
+
+def make_declaration(supplier_id):
+    row = [''] * 59
+    row[0] = supplier_id
+    row[18:22] = ['Contact', 'contact@example.com', 'Supplier {}'.format(supplier_id), 'Address']
+    row[26:28] = ['uk', '12345678']
+    return row
+
+
+def make_lots(supplier_id):
+    return [supplier_id, 'Supplier {}'.format(supplier_id), '', '1', '', '0', '', '2', '', '0', '']
+
+
+def scan_lots(lots, supplier_id):
+    for lot_count in lots:
+        if lot_count[0] == supplier_id:
+            return lot_count
+
+
+def timed(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def look_up_by_scanning(declarations, lots):
+    for declaration in declarations:
+        scan_lots(lots, declaration[0])
+
+
+def look_up_by_index(declarations, lots):
+    lot_counts = index_lot_counts(lots)
+    for declaration in declarations:
+        lot_counts_for_supplier_id(lot_counts, declaration[0])
+
+
+def build(declarations, lots):
+    client = mock.Mock()
+    client.find_framework_suppliers.return_value = {'supplierFrameworks': [
+        {'supplierId': int(declaration[0]), 'onFramework': True} for declaration in declarations
+    ]}
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        build_framework_agreements(client, declarations, lots, output_dir)
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    supplier_ids = [str(500000 + i) for i in range(int(arguments['--suppliers']))]
+    declarations = [make_declaration(supplier_id) for supplier_id in supplier_ids]
+    lots = [make_lots(supplier_id) for supplier_id in reversed(supplier_ids)]
+
+    print("{} suppliers".format(len(supplier_ids)))
+    print("{:>28} {:>10}".format('lot count lookup', 'seconds'))
+    print("{:>28} {:>10.2f}".format('scan for each declaration', timed(look_up_by_scanning, declarations, lots)))
+    print("{:>28} {:>10.2f}".format('index', timed(look_up_by_index, declarations, lots)))
+    print("{:>28} {:>10.2f}".format('whole build with index', timed(build, declarations, lots)))
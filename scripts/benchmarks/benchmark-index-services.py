@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Benchmark index-services against a local fake search-api.
+
+Starts an in-process HTTP server that accepts single document, delete and bulk
+requests (sleeping for --latency milliseconds per request to simulate search-api
+overhead).
+
+`batch-sizes` indexes a synthetic set of services once per batch size and reports
+services per second.
+
+`client-reuse` sends --requests single-service bulk requests from one thread, first
+creating a new client for each request and then reusing the indexer's thread-local
+pooled client, and reports the mean latency per request.
+
+Usage:
+    scripts/benchmarks/benchmark-index-services.py batch-sizes [options]
+    scripts/benchmarks/benchmark-index-services.py client-reuse [options]
+
+Options:
+    --services=<count>       Number of synthetic services to index [default: 5000]
+    --batch-sizes=<sizes>    Comma-separated batch sizes to compare [default: 1,50,200,1000]
+    --requests=<count>       Number of requests for the client-reuse benchmark [default: 1000]
+    --latency=<ms>           Simulated search-api latency per request [default: 5]
+    --serial                 Index services from a single thread
+"""
+import json
+import sys
+import threading
+import time
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from docopt import docopt
+
+sys.path.insert(0, '.')
+from dmscripts.index_services import SearchAPIClient, make_indexer, index_services
+from dmscripts import logging
+
+logger = logging.configure_logger({'dmapiclient': logging.WARNING, 'script': logging.WARNING})
+
+
+class FakeSearchAPIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections alive between requests like the real search-api does. Nagle's
+    # algorithm has to be disabled or responses on a reused connection stall on delayed ACKs.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def _respond(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        data = self._read_json()
+        time.sleep(self.latency)
+        self._respond(200, {'message': 'acknowledged', 'type': data.get('type')})
+
+    def do_DELETE(self):
+        time.sleep(self.latency)
+        self._respond(200, {'message': 'deleted'})
+
+    def do_POST(self):
+        operations = self._read_json().get('operations', [])
+        time.sleep(self.latency)
+        self._respond(200, {'results': [
+            {'id': operation['id'], 'status': 200} for operation in operations
+        ]})
+
+
+class FakeSearchAPIServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_fake_search_api(latency):
+    FakeSearchAPIHandler.latency = latency
+    server = FakeSearchAPIServer(('127.0.0.1', 0), FakeSearchAPIHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+def make_services(count):
+    return [
+        {
+            'id': six.text_type(5000000000000000 + i),
+            'status': 'published' if i % 10 else 'disabled',
+            'serviceName': 'Service {}'.format(i),
+            'serviceSummary': 'A synthetic service used to benchmark indexing ' * 5,
+            'lot': 'SaaS',
+            'frameworkSlug': 'g-cloud-7',
+        }
+        for i in range(count)
+    ]
+
+
+def run_benchmark(search_api_url, services, batch_size, serial):
+    # Batch size 1 is the per-document baseline using the single document endpoints
+    indexer = make_indexer(search_api_url, 'token', 'benchmark', batch_size if batch_size > 1 else None)
+
+    start = time.time()
+    ok = index_services(indexer, services, serial=serial, batch_size=batch_size)
+    elapsed = time.time() - start
+
+    return ok, elapsed
+
+
+def time_requests(get_client, services):
+    start = time.time()
+    for service in services:
+        get_client().bulk([{'action': 'index', 'id': service['id'], 'service': service}], index='benchmark')
+
+    return (time.time() - start) / len(services)
+
+
+def benchmark_batch_sizes(search_api_url, arguments):
+    services = make_services(int(arguments['--services']))
+    batch_sizes = [int(size) for size in arguments['--batch-sizes'].split(',')]
+
+    print("{:>10} {:>10} {:>12} {:>6}".format('batch size', 'seconds', 'services/s', 'ok'))
+    for batch_size in batch_sizes:
+        ok, elapsed = run_benchmark(search_api_url, services, batch_size, arguments['--serial'])
+        print("{:>10} {:>10.2f} {:>12.1f} {:>6}".format(batch_size, elapsed, len(services) / elapsed, ok))
+
+
+def benchmark_client_reuse(search_api_url, arguments):
+    services = make_services(int(arguments['--requests']))
+    indexer = make_indexer(search_api_url, 'token', 'benchmark')
+
+    timings = [
+        ('new client per request', time_requests(lambda: SearchAPIClient(search_api_url, 'token'), services)),
+        ('thread-local pooled client', time_requests(indexer.get_client, services)),
+    ]
+
+    print("{:>28} {:>12}".format('client', 'ms/request'))
+    for name, latency in timings:
+        print("{:>28} {:>12.3f}".format(name, latency * 1000))
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    server, search_api_url = start_fake_search_api(int(arguments['--latency']) / 1000.0)
+
+    if arguments['batch-sizes']:
+        benchmark_batch_sizes(search_api_url, arguments)
+    elif arguments['client-reuse']:
+        benchmark_client_reuse(search_api_url, arguments)
+
+    server.shutdown()
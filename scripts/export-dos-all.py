@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Export DOS specialists, outcomes, user research participants and labs
+
+Fetches every interested supplier's details and drafts once and writes the same
+CSV files as the export-dos-specialists, export-dos-outcomes, export-dos-participants
+and export-dos-labs scripts.
+
+Usage:
+    scripts/export-dos-all.py <stage> <api_token> <content_path> [<output_dir>] [options]
+
+Options:
+    --from-snapshot=<snapshot_file>  Read suppliers and drafts from a file made by
+                                     snapshot-framework.py instead of the API
+    --cache-file=<cache_file>        Cache supplier and draft responses from the API in this
+                                     file and reuse them on later runs
+"""
+import sys
+sys.path.insert(0, '.')
+
+from docopt import docopt
+from dmscripts.env import get_api_endpoint_from_stage
+from dmscripts.export_dos_suppliers import FRAMEWORK_SLUG
+from dmscripts.export_dos_lots import export_all_lots
+from dmscripts.snapshot import get_data_client
+from dmscripts.api_cache import CachingDataAPIClient
+from dmutils.content_loader import ContentLoader
+from dmscripts.logging import configure_logger, WARNING
+
+logger = configure_logger({"dmapiclient": WARNING})
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    STAGE = arguments['<stage>']
+    API_TOKEN = arguments['<api_token>']
+    CONTENT_PATH = arguments['<content_path>']
+    OUTPUT_DIR = arguments['<output_dir>'] or 'output'
+
+    client = get_data_client(get_api_endpoint_from_stage(STAGE), API_TOKEN, arguments['--from-snapshot'])
+    if arguments['--cache-file']:
+        client = CachingDataAPIClient(client, arguments['--cache-file'])
+
+    content_loader = ContentLoader(CONTENT_PATH)
+    content_loader.load_manifest(FRAMEWORK_SLUG, "services", "edit_submission")
+    content_manifest = content_loader.get_manifest(FRAMEWORK_SLUG, "edit_submission")
+
+    export_all_lots(client, content_manifest, OUTPUT_DIR)
+
+    if arguments['--cache-file']:
+        for method, counts in sorted(client.stats().items()):
+            logger.info("{method}: {hits} cache hits, {misses} misses", extra=dict(counts, method=method))
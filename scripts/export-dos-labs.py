@@ -2,18 +2,23 @@
 """Export DOS user research labs
 
 Usage:
-    scripts/export-dos-labs.py <stage> <api_token>
+    scripts/export-dos-labs.py <stage> <api_token> [options]
+
+Options:
+    --from-snapshot=<snapshot_file>  Read suppliers and drafts from a file made by
+                                     snapshot-framework.py instead of the API
 """
 import sys
 sys.path.insert(0, '.')
 
-from multiprocessing.pool import ThreadPool
 import itertools
 
 from docopt import docopt
 from dmscripts.env import get_api_endpoint_from_stage
 from dmscripts.export_dos_suppliers import find_suppliers, FRAMEWORK_SLUG, add_framework_info, add_draft_services
-from dmapiclient import DataAPIClient
+from dmscripts.export_dos_lots import make_labs_row
+from dmscripts.pipeline import Pipeline
+from dmscripts.snapshot import get_data_client
 
 if sys.version_info[0] < 3:
     import unicodecsv as csv
@@ -22,11 +27,11 @@ else:
 
 
 def find_all_labs(client):
-    pool = ThreadPool(20)
-    records = find_suppliers(client, FRAMEWORK_SLUG)
-    records = pool.imap(add_framework_info(client, FRAMEWORK_SLUG), records)
-    records = filter(lambda record: record['onFramework'], records)
-    records = pool.imap(add_draft_services(client, FRAMEWORK_SLUG), records)
+    pipeline = Pipeline() \
+        .map(add_framework_info(client, FRAMEWORK_SLUG)) \
+        .filter(lambda record: record['onFramework']) \
+        .map(add_draft_services(client, FRAMEWORK_SLUG))
+    records = pipeline.run(find_suppliers(client, FRAMEWORK_SLUG))
     services = itertools.chain.from_iterable(record['services'] for record in records)
     services = filter(
         lambda record: record['lot'] == 'user-research-studios' and record['status'] == 'submitted',
@@ -37,15 +42,14 @@ def find_all_labs(client):
 
 def write_csv(services, filename):
     writer = None
-    bad_fields = ['links']
 
     with open(filename, "w+") as f:
         for service in services:
-            service = {key: value for key, value in service.items() if key not in bad_fields}
+            row = make_labs_row(service)
             if writer is None:
-                writer = csv.DictWriter(f, fieldnames=sorted(service.keys()))
+                writer = csv.DictWriter(f, fieldnames=[key for key, _ in row])
                 writer.writeheader()
-            writer.writerow(service)
+            writer.writerow(dict(row))
 
 
 if __name__ == '__main__':
@@ -54,5 +58,5 @@ if __name__ == '__main__':
     STAGE = arguments['<stage>']
     API_TOKEN = arguments['<api_token>']
 
-    client = DataAPIClient(get_api_endpoint_from_stage(STAGE), API_TOKEN)
+    client = get_data_client(get_api_endpoint_from_stage(STAGE), API_TOKEN, arguments['--from-snapshot'])
     write_csv(find_all_labs(client), "output/dos-labs.csv")
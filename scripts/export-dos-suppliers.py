@@ -11,10 +11,14 @@ Produces three files;
    incorrectly.
 
 Usage:
-    scripts/export-dos-suppliers.py [-h] <stage> <api_token> <content_path> <output_dir> [<supplier_id_file>]
+    scripts/export-dos-suppliers.py [-h] <stage> <api_token> <content_path> <output_dir> [<supplier_id_file>] [options]
 
 Options:
     -h --help
+    --from-snapshot=<snapshot_file>  Read suppliers and drafts from a file made by
+                                     snapshot-framework.py instead of the API
+    --cache-file=<cache_file>        Cache supplier and draft responses from the API in this
+                                     file and reuse them on later runs
 """
 import sys
 sys.path.insert(0, '.')
@@ -22,8 +26,12 @@ sys.path.insert(0, '.')
 from docopt import docopt
 from dmscripts.env import get_api_endpoint_from_stage
 from dmscripts.export_dos_suppliers import export_suppliers
-from dmapiclient import DataAPIClient
+from dmscripts.snapshot import get_data_client
+from dmscripts.api_cache import CachingDataAPIClient
 from dmutils.content_loader import ContentLoader
+from dmscripts.logging import configure_logger, WARNING
+
+logger = configure_logger({"dmapiclient": WARNING})
 
 
 if __name__ == '__main__':
@@ -34,7 +42,9 @@ if __name__ == '__main__':
     CONTENT_PATH = arguments['<content_path>']
     OUTPUT_DIR = arguments['<output_dir>']
 
-    client = DataAPIClient(get_api_endpoint_from_stage(STAGE), API_TOKEN)
+    client = get_data_client(get_api_endpoint_from_stage(STAGE), API_TOKEN, arguments['--from-snapshot'])
+    if arguments['--cache-file']:
+        client = CachingDataAPIClient(client, arguments['--cache-file'])
     content_loader = ContentLoader(CONTENT_PATH)
 
     supplier_id_file = arguments['<supplier_id_file>']
@@ -45,3 +55,7 @@ if __name__ == '__main__':
         supplier_ids = None
 
     export_suppliers(client, content_loader, OUTPUT_DIR, supplier_ids)
+
+    if arguments['--cache-file']:
+        for method, counts in sorted(client.stats().items()):
+            logger.info("{method}: {hits} cache hits, {misses} misses", extra=dict(counts, method=method))
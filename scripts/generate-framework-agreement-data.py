@@ -2,6 +2,11 @@
 
 Usage:
     scripts/generate_framework_agreement-data.py <lots_file> <declaration_file> <output_dir> <api_url> <api_token>
+                                                 [--stream]
+
+Options:
+    --stream    Validate and process the CSV files in a single pass without loading the declarations into
+                memory. Invalid rows are skipped and every problem is reported with its row number at the end
 
 Example:
     ./generate-framework-agreement-data.py lots.csv declarations.csv framework-outputs localhost:5000 myToken
@@ -11,13 +16,39 @@ sys.path.insert(0, '.')
 
 from docopt import docopt
 from dmscripts.generate_framework_agreement_data import check_lots_csv, read_csv, \
-    check_declarations_csv, build_framework_agreements
+    check_declarations_csv, build_framework_agreements, read_validated_csv, lots_row_errors, \
+    declaration_row_errors
 from dmapiclient import DataAPIClient
 
+
+def build_streaming(client, lots_file, declaration_file, output_dir):
+    lot_errors = []
+    declaration_errors = []
+
+    build_framework_agreements(client,
+                               read_validated_csv(declaration_file, declaration_row_errors, declaration_errors),
+                               read_validated_csv(lots_file, lots_row_errors(), lot_errors),
+                               output_dir)
+
+    for row_number, error in lot_errors:
+        print("Lots CSV row {}: {}".format(row_number, error))
+    for row_number, error in declaration_errors:
+        print("Declarations CSV row {}: {}".format(row_number, error))
+
+    if lot_errors or declaration_errors:
+        sys.exit("Skipped invalid rows: {} lots errors, {} declarations errors".format(
+            len(lot_errors), len(declaration_errors)))
+
+
 if __name__ == '__main__':
 
     arguments = docopt(__doc__)
 
+    if arguments['--stream']:
+        client = DataAPIClient(arguments['<api_url>'], arguments['<api_token>'])
+        build_streaming(client, arguments['<lots_file>'], arguments['<declaration_file>'], arguments['<output_dir>'])
+        sys.exit("Success")
+
     supplier_lots = read_csv(arguments['<lots_file>'])
     supplier_declarations = read_csv(arguments['<declaration_file>'])
 
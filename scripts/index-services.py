@@ -7,124 +7,95 @@ Usage:
     --serial        Do not run in parallel (useful for debugging)
     --index=<index>  Search API index name [default: g-cloud]
     --frameworks=<frameworks> Optional comma-separated list of framework slugs that should be indexed
+    --batch-size=<batch_size>  Send services to search-api in bulk requests of this many services
+    --state-file=<state_file>  Only index services updated since the watermark saved in this file by
+                               the last successful run, then save the new watermark
+    --pool-size=<pool_size>  Number of search-api connections to keep open for reuse. Defaults to --max-workers
+    --checkpoint-file=<checkpoint_file>  Periodically save progress to this file so the run can be resumed
+    --resume        Continue from the last checkpoint saved in --checkpoint-file
+    --reconcile     Compare the index with the data API and only index missing or stale services
+                    and delete orphaned documents
+    --alias=<alias>  Build a new timestamped index and point this alias at it once it is complete
+    --prefetch=<pages>  Number of data API pages to fetch ahead of the indexer [default: 2]
+    --max-buffered-services=<count>  Maximum number of services to hold in prefetched pages and
+                                     queued indexer batches [default: 10000]
+    --min-workers=<count>  Minimum number of concurrent search-api requests [default: 10]
+    --max-workers=<count>  Maximum number of concurrent search-api requests. If higher than --min-workers
+                           concurrency is adjusted to search-api latency and errors [default: 10]
+    --stats-file=<stats_file>  Write a JSON summary of stage timings, retries and rates to this file
+    --shard-by=<shard_by>  Index in parallel worker processes: 'framework' runs one process for each of
+                           --frameworks, 'page' runs --shards processes each indexing every Nth page
+    --shards=<shards>  Number of processes when sharding by page [default: 4]
 
 Example:
     ./index-services.py dev --api-token=myToken --search-api-token=myToken --frameworks=g-cloud-6,g-cloud-7"
 """
 
 import sys
-from multiprocessing.pool import ThreadPool
 import six
-from six.moves import map
-from datetime import datetime
 
-import backoff
 from docopt import docopt
 
-import dmapiclient
-
 sys.path.insert(0, '.')
 from dmscripts.env import get_api_endpoint_from_stage
+from dmscripts.index_services import do_index, do_reconcile, do_sharded_index
 from dmscripts import logging
 
 logger = logging.configure_logger({'dmapiclient': logging.WARNING})
 
 
-def request_services(api_url, api_access_token, frameworks):
-
-    data_client = dmapiclient.DataAPIClient(
-        api_url,
-        api_access_token
-    )
-
-    return data_client.find_services_iter(framework=frameworks)
-
-
-def print_progress(counter, start_time):
-    if counter % 100 == 0:
-        time_delta = datetime.utcnow() - start_time
-        logger.info("{counter} in {time} ({rps}/s)", extra={
-            'counter': counter, 'time': time_delta, 'rps': counter / time_delta.total_seconds()
-        })
-
-
-class ServiceIndexer(object):
-    def __init__(self, endpoint, access_token, index):
-        self.endpoint = endpoint
-        self.access_token = access_token
-        self.index = index
-
-    def __call__(self, service):
-        client = dmapiclient.SearchAPIClient(self.endpoint, self.access_token)
-
-        try:
-            self.index_service(client, service)
-            return True
-        except dmapiclient.APIError:
-            logger.exception("{service_id} not indexed", extra={'service_id': service.get('id')})
-            return False
-
-    @backoff.on_exception(backoff.expo, dmapiclient.HTTPError, max_tries=5)
-    def index_service(self, client, service):
-        if service['status'] == 'published':
-            client.index(service['id'], service, index=self.index)
-        else:
-            client.delete(service['id'], index=self.index)
-
-    def create_index(self):
-        client = dmapiclient.SearchAPIClient(self.endpoint, self.access_token)
-        logger.info("Creating {index} index", extra={'index': self.index})
-
-        try:
-            result = client.create_index(self.index)
-            logger.info("Index creation response: {response}", extra={'response': result})
-        except dmapiclient.HTTPError as e:
-            if 'already exists as alias' in e.message:
-                logger.info("Skipping index creation for alias {index}", extra={'index': self.index})
-            else:
-                raise
-
-
-def do_index(search_api_url, search_api_access_token, data_api_url, data_api_access_token, serial, index, frameworks):
-    logger.info("Search API URL: {search_api_url}", extra={'search_api_url': search_api_url})
-    logger.info("Data API URL: {data_api_url}", extra={'data_api_url': data_api_url})
-
-    if serial:
-        pool = None
-        mapper = map
-    else:
-        pool = ThreadPool(10)
-        mapper = pool.imap_unordered
-
-    indexer = ServiceIndexer(search_api_url, search_api_access_token, index)
-    indexer.create_index()
-
-    counter = 0
-    start_time = datetime.utcnow()
-    status = True
-
-    services = request_services(data_api_url, data_api_access_token, frameworks)
-    for result in mapper(indexer, services):
-        counter += 1
-        status = status and result
-        print_progress(counter, start_time)
-
-    return status
-
 if __name__ == "__main__":
     arguments = docopt(__doc__)
     chosen_frameworks = arguments['--frameworks']
     if not isinstance(chosen_frameworks, six.string_types):
         chosen_frameworks = None
-    ok = do_index(
+    if arguments['--resume'] and not arguments['--checkpoint-file']:
+        sys.exit("--resume requires --checkpoint-file")
+    if int(arguments['--min-workers']) > int(arguments['--max-workers']):
+        sys.exit("--min-workers can't be higher than --max-workers")
+    if arguments['--alias'] and (arguments['--state-file'] or arguments['--checkpoint-file']):
+        sys.exit("--alias builds a complete new index and can't be used with --state-file or --checkpoint-file")
+    if arguments['--reconcile'] and (arguments['--alias'] or arguments['--state-file'] or
+                                     arguments['--checkpoint-file']):
+        sys.exit("--reconcile can't be used with --alias, --state-file or --checkpoint-file")
+    if arguments['--shard-by'] not in (None, 'framework', 'page'):
+        sys.exit("--shard-by must be 'framework' or 'page'")
+    if arguments['--shard-by'] == 'framework' and not chosen_frameworks:
+        sys.exit("--shard-by=framework requires --frameworks")
+    if arguments['--shard-by'] and (arguments['--alias'] or arguments['--reconcile'] or arguments['--serial']):
+        sys.exit("--shard-by can't be used with --alias, --reconcile or --serial")
+
+    common_arguments = dict(
         data_api_url=get_api_endpoint_from_stage(arguments['<stage>'], 'api'),
         data_api_access_token=arguments['--api-token'],
         search_api_url=get_api_endpoint_from_stage(arguments['<stage>'], 'search-api'),
         search_api_access_token=arguments['--search-api-token'],
         serial=arguments['--serial'],
         index=arguments['--index'],
-        frameworks=chosen_frameworks
+        frameworks=chosen_frameworks,
+        batch_size=int(arguments['--batch-size']) if arguments['--batch-size'] else None,
+        pool_size=int(arguments['--pool-size']) if arguments['--pool-size'] else None,
     )
 
+    if arguments['--reconcile']:
+        ok = do_reconcile(workers=int(arguments['--max-workers']), **common_arguments)
+    else:
+        index = do_sharded_index if arguments['--shard-by'] else do_index
+        if arguments['--shard-by']:
+            common_arguments.update(shard_by=arguments['--shard-by'], shard_count=int(arguments['--shards']))
+
+        ok = index(
+            state_file=arguments['--state-file'],
+            checkpoint_file=arguments['--checkpoint-file'],
+            resume=arguments['--resume'],
+            alias=arguments['--alias'],
+            prefetch=int(arguments['--prefetch']),
+            max_buffered_services=int(arguments['--max-buffered-services']),
+            min_workers=int(arguments['--min-workers']),
+            max_workers=int(arguments['--max-workers']),
+            stats_file=arguments['--stats-file'],
+            **common_arguments
+        )
+
     if not ok:
         sys.exit(1)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""Save a framework's interested suppliers to a local snapshot file
+
+Fetches every interested supplier's details, framework interest and declaration,
+and draft services once, and writes them to an SQLite file. The export-dos scripts
+can then read from the snapshot with --from-snapshot instead of calling the API.
+
+Usage:
+    scripts/snapshot-framework.py <stage> <api_token> <framework_slug> <snapshot_file> [options]
+
+Options:
+    --workers=<count>  Number of concurrent API requests [default: 10]
+"""
+import sys
+sys.path.insert(0, '.')
+
+from docopt import docopt
+from dmscripts.env import get_api_endpoint_from_stage
+from dmscripts.snapshot import take_snapshot
+from dmapiclient import DataAPIClient
+from dmscripts.logging import configure_logger, WARNING
+
+logger = configure_logger({"dmapiclient": WARNING})
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+
+    STAGE = arguments['<stage>']
+    API_TOKEN = arguments['<api_token>']
+    FRAMEWORK_SLUG = arguments['<framework_slug>']
+    SNAPSHOT_FILE = arguments['<snapshot_file>']
+
+    client = DataAPIClient(get_api_endpoint_from_stage(STAGE), API_TOKEN)
+
+    count = take_snapshot(client, FRAMEWORK_SLUG, SNAPSHOT_FILE, workers=int(arguments['--workers']))
+    logger.info("Saved {count} suppliers to {snapshot_file}",
+                extra={'count': count, 'snapshot_file': SNAPSHOT_FILE})
@@ -0,0 +1,158 @@
+import mock
+import pytest
+
+from dmscripts.api_cache import CachingDataAPIClient
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def api_client(mock_data_client):
+    mock_data_client.base_url = 'http://localhost:5000'
+    return mock_data_client
+
+
+@pytest.fixture
+def cache_file(tmpdir):
+    return str(tmpdir.join('cache.db'))
+
+
+def caching_client(request, client, cache_file, **kwargs):
+    caching = CachingDataAPIClient(client, cache_file, **kwargs)
+    request.addfinalizer(caching.close)
+    return caching
+
+
+def test_repeated_calls_are_answered_from_the_cache(request, api_client, cache_file):
+    api_client.get_supplier.return_value = {'suppliers': {'id': 1}}
+    client = caching_client(request, api_client, cache_file)
+
+    assert client.get_supplier(1) == {'suppliers': {'id': 1}}
+    assert client.get_supplier(1) == {'suppliers': {'id': 1}}
+
+    assert api_client.get_supplier.call_count == 1
+    assert client.stats() == {'get_supplier': {'hits': 1, 'misses': 1}}
+
+
+def test_calls_with_different_arguments_are_cached_separately(request, api_client, cache_file):
+    api_client.find_draft_services.side_effect = lambda supplier_id, framework: {
+        'services': [{'id': supplier_id, 'frameworkSlug': framework}]
+    }
+    client = caching_client(request, api_client, cache_file)
+
+    client.find_draft_services(1, framework='g-cloud-7')
+    client.find_draft_services(1, framework='digital-outcomes-and-specialists')
+    client.find_draft_services(1, framework='g-cloud-7')
+
+    assert api_client.find_draft_services.call_count == 2
+
+
+def test_cache_is_kept_between_runs(request, api_client, cache_file):
+    api_client.get_supplier.return_value = {'suppliers': {'id': 1}}
+    caching_client(request, api_client, cache_file).get_supplier(1)
+
+    client = caching_client(request, api_client, cache_file)
+
+    assert client.get_supplier(1) == {'suppliers': {'id': 1}}
+    assert api_client.get_supplier.call_count == 1
+
+
+def test_responses_are_cached_separately_for_each_api(request, api_client, cache_file):
+    api_client.get_supplier.return_value = {'suppliers': {'id': 1, 'name': 'Local supplier'}}
+    caching_client(request, api_client, cache_file).get_supplier(1)
+
+    preview_client = mock.Mock(base_url='https://api.preview.example.com')
+    preview_client.get_supplier.return_value = {'suppliers': {'id': 1, 'name': 'Preview supplier'}}
+    client = caching_client(request, preview_client, cache_file)
+
+    assert client.get_supplier(1) == {'suppliers': {'id': 1, 'name': 'Preview supplier'}}
+    assert preview_client.get_supplier.call_count == 1
+
+
+def test_responses_expire_after_the_method_ttl(request, api_client, cache_file, clock):
+    api_client.get_supplier_framework_info.return_value = {'frameworkInterest': {}}
+    client = caching_client(request, api_client, cache_file, clock=clock,
+                            ttls={'get_supplier_framework_info': 60})
+
+    client.get_supplier_framework_info(1, 'g-cloud-7')
+    clock.now += 59
+    client.get_supplier_framework_info(1, 'g-cloud-7')
+    clock.now += 1
+    client.get_supplier_framework_info(1, 'g-cloud-7')
+
+    assert api_client.get_supplier_framework_info.call_count == 2
+
+
+def test_iterator_methods_are_cached_as_lists(request, api_client, cache_file):
+    api_client.find_draft_services_iter.side_effect = lambda supplier_id, framework: iter([{'id': 1}, {'id': 2}])
+    client = caching_client(request, api_client, cache_file)
+
+    assert list(client.find_draft_services_iter(1, framework='g-cloud-7')) == [{'id': 1}, {'id': 2}]
+    assert list(client.find_draft_services_iter(1, framework='g-cloud-7')) == [{'id': 1}, {'id': 2}]
+    assert api_client.find_draft_services_iter.call_count == 1
+
+
+def test_least_recently_used_responses_are_evicted(request, api_client, cache_file):
+    api_client.get_supplier.side_effect = lambda supplier_id: {'suppliers': {'id': supplier_id}}
+    response_size = len('{"suppliers": {"id": 1}}')
+    client = caching_client(request, api_client, cache_file, max_size=response_size * 2)
+
+    client.get_supplier(1)
+    client.get_supplier(2)
+    client.get_supplier(1)
+    client.get_supplier(3)
+    assert client.evictions == 1
+
+    client.get_supplier(1)
+    client.get_supplier(2)
+
+    assert api_client.get_supplier.call_count == 4
+
+
+def test_errors_are_not_cached(request, api_client, cache_file):
+    api_client.get_supplier.side_effect = [ValueError("API error"), {'suppliers': {'id': 1}}]
+    client = caching_client(request, api_client, cache_file)
+
+    with pytest.raises(ValueError):
+        client.get_supplier(1)
+
+    assert client.get_supplier(1) == {'suppliers': {'id': 1}}
+
+
+def test_other_reads_are_not_cached(request, api_client, cache_file):
+    api_client.get_framework.return_value = {'frameworks': {}}
+    client = caching_client(request, api_client, cache_file)
+
+    client.get_framework('g-cloud-7')
+    client.get_framework('g-cloud-7')
+
+    assert api_client.get_framework.call_count == 2
+    assert client.stats() == {}
+
+
+def test_writes_are_refused_by_default(request, api_client, cache_file):
+    client = caching_client(request, api_client, cache_file)
+
+    with pytest.raises(AttributeError):
+        client.set_framework_result(1, 'g-cloud-7', True, 'user')
+
+    assert not api_client.set_framework_result.called
+
+
+def test_writes_go_to_the_api_when_allowed(request, api_client, cache_file):
+    client = caching_client(request, api_client, cache_file, allow_writes=True)
+
+    client.set_framework_result(1, 'g-cloud-7', True, 'user')
+
+    api_client.set_framework_result.assert_called_once_with(1, 'g-cloud-7', True, 'user')
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import mock
+import pytest
+
+from dmscripts.bad_words import (
+    BadWordsMatcher, find_bad_words_in_service, check_services_with_bad_words, find_services_by_supplier,
+    scan_for_bad_words, ScanCache, context_snippet, Normaliser, get_field_values, output_compact_bad_words,
+    get_bad_words
+)
+
+
+def test_matcher_finds_whole_words_case_insensitively():
+    matcher = BadWordsMatcher(['bad', 'Word'])
+
+    assert matcher.find('A BAD word, badger and words') == [('bad', 2, 5), ('Word', 6, 10)]
+
+
+def test_matcher_finds_overlapping_words():
+    matcher = BadWordsMatcher(['bad', 'bad word', 'word'])
+
+    assert matcher.find('a bad word') == [('bad', 2, 5), ('bad word', 2, 10), ('word', 6, 10)]
+
+
+def test_matcher_escapes_words():
+    matcher = BadWordsMatcher(['a.b', 'x*'])
+
+    assert matcher.find('axb a.b xx') == [('a.b', 4, 7)]
+
+
+def test_matcher_with_no_words():
+    assert BadWordsMatcher([]).find('anything') == []
+
+
+def test_matcher_finds_non_ascii_words():
+    matcher = BadWordsMatcher([u'über'])
+
+    assert matcher.find(u'Ein Über Service') == [(u'über', 4, 8)]
+
+
+def test_normaliser_folds_case_and_accents_of_ascii_text_without_an_offset_map():
+    assert Normaliser().normalise(u'A Bad Word') == (u'a bad word', None)
+
+
+def test_normaliser_maps_normalised_offsets_to_original_text():
+    normalised, offsets = Normaliser().normalise(u'\ufb01ne Stra\xdfe u\u0308')
+
+    assert normalised == u'fine strasse u'
+    assert offsets == [0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 8, 9, 10, 11]
+
+
+def test_normaliser_keeps_offsets_of_non_ascii_text_that_does_not_change_length():
+    assert Normaliser().normalise(u'Caf\xe9 \u2013 \xa35 supplier\u2019s') == (u'cafe \u2013 \xa35 supplier\u2019s', None)
+
+
+def test_normaliser_maps_offsets_when_changes_in_length_cancel_out():
+    assert Normaliser().normalise(u'\ufb01u\u0308') == (u'fiu', [0, 0, 1])
+
+
+def test_normaliser_applies_substitutions():
+    assert Normaliser({'4': 'a', '$': 's'}).normalise(u'B4D $ERVICE') == (u'bad service', None)
+    assert Normaliser({'4': 'a'}).normalise(u'b4d \xfc')[0] == u'bad u'
+
+
+def test_normaliser_builds_an_offset_map_for_substitutions_that_change_length():
+    assert Normaliser({'&': 'and'}).normalise(u'b&b') == (u'bandb', [0, 1, 1, 1, 2])
+
+
+def test_matcher_ignores_accents_and_applies_substitutions():
+    matcher = BadWordsMatcher([u'\xfcber', 'bad'], {'4': 'a'})
+
+    assert matcher.find(u'\ufb01ne UBER b4d \xdcber') == [(u'\xfcber', 4, 8), ('bad', 9, 12), (u'\xfcber', 13, 17)]
+
+
+def test_matcher_end_offsets_cover_the_matched_text_in_the_original_value():
+    matcher = BadWordsMatcher(['strasse', 'fine', 'bandb'], {'&': 'and'})
+
+    assert matcher.find(u'Stra\xdfe \ufb01ne b&b') == [('strasse', 0, 6), ('fine', 7, 10), ('bandb', 11, 14)]
+
+
+def test_compact_report_context_uses_the_length_of_the_matched_text():
+    writer = mock.Mock()
+    value = u'Stra\xdfe und mehr'
+    matches = BadWordsMatcher(['strasse']).find(value)
+
+    output_compact_bad_words({'supplierId': 1, 'frameworkSlug': 'g-cloud-8'},
+                             {'id': 1, 'serviceName': 'Name', 'serviceSummary': 'Summary'},
+                             'serviceName', value, matches, 1, writer)
+
+    assert writer.writerow.call_args[0][0]['Blacklisted Word Context'] == u'Stra\xdfe ...'
+
+
+def test_get_bad_words_reads_non_ascii_words_as_text(tmpdir):
+    words_file = tmpdir.join('bad-words.txt')
+    words_file.write(u'# Words to look for\ncaf\xe9\n\nb&b\n'.encode('utf-8'), mode='wb')
+
+    words = get_bad_words(str(words_file))
+
+    assert words == [u'caf\xe9', u'b&b']
+    assert BadWordsMatcher(words, {'&': 'and'}).find(u'CAFE b&b') == [(u'caf\xe9', 0, 4), (u'b&b', 5, 8)]
+
+
+def test_get_field_values_walks_nested_values_in_order():
+    service = {
+        'serviceName': 'Name',
+        'serviceFeatures': ['one', {'two': 'three'}, ['four']],
+        'pricing': {'prices': [{'unit': 'day', 'price': 9.5, 'vat': True}], 'free': None},
+    }
+
+    assert sorted(get_field_values(service)) == sorted([
+        ('serviceName', 'Name'),
+        ('serviceFeatures[0]', 'one'),
+        ('serviceFeatures[1].two', 'three'),
+        ('serviceFeatures[2][0]', 'four'),
+        ('pricing.prices[0].unit', 'day'),
+        ('pricing.prices[0].price', '9.5'),
+    ])
+    assert [path for path, value in get_field_values({'a': ['b', 'c', {'d': 'e', 'f': 'g'}], 'h': 'i'})] == \
+        ['a[0]', 'a[1]', 'a[2].d', 'a[2].f', 'h']
+
+
+def test_get_field_values_handles_deeply_nested_values():
+    service = value = {}
+    for _ in range(5000):
+        value['a'] = {}
+        value = value['a']
+    value['b'] = 'bad'
+
+    assert [value for path, value in get_field_values(service)] == ['bad']
+
+
+def test_find_bad_words_in_service_groups_matches_by_field_value():
+    matcher = BadWordsMatcher(['bad'])
+    service = {'serviceName': 'bad bad', 'serviceFeatures': ['fine', 'Bad'], 'price': 1}
+
+    assert sorted(find_bad_words_in_service(matcher, service)) == [
+        ('serviceFeatures[1]', 'Bad', [('bad', 0, 3)]),
+        ('serviceName', 'bad bad', [('bad', 0, 3), ('bad', 4, 7)]),
+    ]
+
+
+def test_check_services_with_bad_words_writes_a_row_for_each_match(tmpdir):
+    client = mock.Mock()
+    client.find_draft_services.return_value = {'services': [
+        {'id': 1, 'status': 'submitted', 'serviceName': 'A bad service', 'serviceSummary': 'Summary'},
+        {'id': 2, 'status': 'not-submitted', 'serviceName': 'Another bad service', 'serviceSummary': 'Summary'},
+    ]}
+
+    check_services_with_bad_words(str(tmpdir), 'g-cloud-8', client,
+                                  [{'supplierId': 123, 'frameworkSlug': 'g-cloud-8'}], ['bad'])
+
+    lines = tmpdir.join('g-cloud-8-services-with-blacklisted-words.csv').read().splitlines()
+    assert lines[1:] == ['123,g-cloud-8,1,A bad service,Summary,serviceName,A bad service,bad']
+
+
+def test_context_snippet():
+    assert context_snippet('a very bad service', 7, 3, 3) == '...ry bad se...'
+    assert context_snippet('bad', 0, 3, 3) == 'bad'
+
+
+def _check_compact_report(tmpdir, **kwargs):
+    client = mock.Mock()
+    client.find_draft_services.return_value = {'services': [
+        {'id': 1, 'status': 'submitted', 'serviceName': 'A bad, bad service', 'serviceSummary': 'Worse'},
+    ]}
+
+    check_services_with_bad_words(str(tmpdir), 'g-cloud-8', client,
+                                  [{'supplierId': 123, 'frameworkSlug': 'g-cloud-8'}], ['bad', 'worse'], **kwargs)
+
+
+def test_check_services_with_bad_words_writes_one_row_per_field_with_context(tmpdir):
+    _check_compact_report(tmpdir, context=2)
+
+    lines = tmpdir.join('g-cloud-8-services-with-blacklisted-words.csv').read().splitlines()
+    assert lines[0].endswith('Blacklisted Word Offsets')
+    assert lines[1:] == [
+        '123,g-cloud-8,1,"A bad, bad service",Worse,serviceName,"A bad, ... | ..., bad s...",bad,2; 7',
+        '123,g-cloud-8,1,"A bad, bad service",Worse,serviceSummary,Worse,worse,0',
+    ]
+    assert not tmpdir.join('g-cloud-8-services-with-blacklisted-words.jsonl').check()
+
+
+def test_check_services_with_bad_words_writes_jsonl(tmpdir):
+    _check_compact_report(tmpdir, jsonl=True)
+
+    lines = tmpdir.join('g-cloud-8-services-with-blacklisted-words.jsonl').read().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {
+            'supplierId': 123, 'frameworkSlug': 'g-cloud-8', 'serviceId': 1, 'location': 'serviceName',
+            'matches': [
+                {'word': 'bad', 'offset': 2, 'end': 5, 'context': 'A bad, bad service'},
+                {'word': 'bad', 'offset': 7, 'end': 10, 'context': 'A bad, bad service'},
+            ],
+        },
+        {
+            'supplierId': 123, 'frameworkSlug': 'g-cloud-8', 'serviceId': 1, 'location': 'serviceSummary',
+            'matches': [{'word': 'worse', 'offset': 0, 'end': 5, 'context': 'Worse'}],
+        },
+    ]
+
+
+def test_matcher_offsets_point_into_text_that_changes_length_when_lowercased():
+    matcher = BadWordsMatcher(['bad'])
+
+    assert matcher.find(u'\u0130 BAD') == [('bad', 2, 5)]
+
+
+def test_find_services_by_supplier_yields_suppliers_in_id_order():
+    client = mock.Mock()
+    client.find_services.side_effect = lambda supplier_id, framework: {'services': [{'id': supplier_id}]}
+    client.find_draft_services.side_effect = lambda supplier_id, framework: {'services': [
+        {'id': supplier_id, 'status': 'submitted'}, {'id': 0, 'status': 'not-submitted'}
+    ]}
+    suppliers = [
+        {'supplierId': supplier_id, 'frameworkSlug': 'g-cloud-6' if supplier_id % 2 else 'g-cloud-8'}
+        for supplier_id in [5, 3, 8, 1, 2]
+    ]
+
+    assert [
+        (supplier['supplierId'], [service['id'] for service in services])
+        for supplier, services in find_services_by_supplier(client, suppliers, workers=3)
+    ] == [(1, [1]), (2, [2]), (3, [3]), (5, [5]), (8, [8])]
+
+
+def _supplier_services(count):
+    supplier = {'supplierId': 1, 'frameworkSlug': 'g-cloud-8'}
+    return [
+        (supplier, {'id': i, 'serviceName': 'Service {}'.format(i), 'serviceSummary': 'bad' if i % 3 else 'good'})
+        for i in range(count)
+    ]
+
+
+def test_scan_for_bad_words_in_process():
+    results = list(scan_for_bad_words(_supplier_services(7), ['bad'], chunk_size=2))
+
+    assert [service['id'] for supplier, service, key, value, matches in results] == [1, 2, 4, 5]
+    assert results[0] == (
+        {'supplierId': 1, 'frameworkSlug': 'g-cloud-8'},
+        {'id': 1, 'serviceName': 'Service 1', 'serviceSummary': 'bad'},
+        'serviceSummary', 'bad', [('bad', 0, 3)]
+    )
+
+
+def test_scan_for_bad_words_in_worker_processes_keeps_order():
+    assert list(scan_for_bad_words(_supplier_services(50), ['bad'], processes=2, chunk_size=3)) == \
+        list(scan_for_bad_words(_supplier_services(50), ['bad']))
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_scan_for_bad_words_limits_services_read_ahead(processes):
+    read = []
+
+    def supplier_services():
+        for supplier_service in _supplier_services(100):
+            read.append(supplier_service)
+            yield supplier_service
+
+    results = scan_for_bad_words(supplier_services(), ['bad'], processes=processes, chunk_size=5, max_in_flight=2)
+    next(results)
+    time.sleep(0.2)
+
+    # The chunk being yielded, plus at most two more chunks in flight
+    assert len(read) <= 15
+    results.close()
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_scan_for_bad_words_only_scans_services_missing_from_cache(processes, tmpdir):
+    cache_file = str(tmpdir.join('cache.json'))
+    services = _supplier_services(5)
+    expected = list(scan_for_bad_words(services, ['bad']))
+
+    cache = ScanCache(cache_file, ['bad'])
+    assert list(scan_for_bad_words(services, ['bad'], processes=processes, chunk_size=2, cache=cache)) == expected
+    cache.save()
+
+    services[3][1]['serviceSummary'] = 'bad'
+    cache = ScanCache(cache_file, ['bad'])
+    with mock.patch('dmscripts.bad_words.find_bad_words_in_service') as find_bad_words_in_service:
+        find_bad_words_in_service.return_value = [('serviceSummary', 'bad', [('bad', 0, 3)])]
+        results = list(scan_for_bad_words(services, ['bad'], chunk_size=2, cache=cache))
+
+    assert [service['id'] for supplier, service, key, value, matches in results] == [1, 2, 3, 4]
+    assert find_bad_words_in_service.call_count == 1
+
+
+def test_scan_cache_is_ignored_after_word_list_changes(tmpdir):
+    cache_file = str(tmpdir.join('cache.json'))
+    service = {'id': 1, 'serviceName': 'bad'}
+
+    cache = ScanCache(cache_file, ['bad'])
+    cache.set(service, [('serviceName', 'bad', [('bad', 0, 3)])])
+    cache.save()
+
+    assert ScanCache(cache_file, ['bad']).get(service) == [('serviceName', 'bad', [('bad', 0, 3)])]
+    assert ScanCache(cache_file, ['bad', 'worse']).get(service) is None
+    assert ScanCache(cache_file, ['bad']).get(dict(service, serviceName='worse')) is None
+
+
+def test_scan_cache_only_saves_services_from_this_run(tmpdir):
+    cache_file = str(tmpdir.join('cache.json'))
+    cache = ScanCache(cache_file, ['bad'])
+    cache.set({'id': 1}, [])
+    cache.set({'id': 2}, [])
+    cache.save()
+
+    cache = ScanCache(cache_file, ['bad'])
+    cache.get({'id': 2})
+    cache.save()
+
+    assert list(json.loads(tmpdir.join('cache.json').read())['services']) == ['2']
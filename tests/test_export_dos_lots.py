@@ -0,0 +1,86 @@
+from mock import call
+
+from dmscripts.export_dos_lots import (
+    SupplierLotHandler, LabsHandler, LotCSVWriter, find_suppliers_with_drafts, make_labs_row
+)
+
+
+def _record(supplier_id, on_framework, services):
+    return {
+        'supplier_id': supplier_id,
+        'supplier': {'name': 'Supplier {}'.format(supplier_id)},
+        'declaration': {'status': 'complete'},
+        'onFramework': on_framework,
+        'services': services,
+    }
+
+
+def _draft(lot, status='submitted', **kwargs):
+    return dict(kwargs, lot=lot, lotSlug=lot, status=status)
+
+
+def test_find_suppliers_with_drafts_fetches_each_supplier_once(mock_data_client):
+    mock_data_client.get_interested_suppliers.return_value = {'interestedSuppliers': [1, 2]}
+    mock_data_client.get_supplier.side_effect = lambda supplier_id: {'suppliers': {'id': supplier_id}}
+    mock_data_client.get_supplier_framework_info.return_value = {
+        'frameworkInterest': {'declaration': {'status': 'complete'}, 'onFramework': True}
+    }
+    mock_data_client.find_draft_services.side_effect = lambda supplier_id, framework: {'services': [
+        _draft('digital-outcomes', id=supplier_id), _draft('digital-specialists', status='not-submitted')
+    ]}
+
+    records = list(find_suppliers_with_drafts(mock_data_client, 'digital-outcomes-and-specialists'))
+
+    assert [record['supplier_id'] for record in records] == [1, 2]
+    assert [len(record['services']) for record in records] == [2, 2]
+    mock_data_client.find_draft_services.assert_has_calls([
+        call(1, framework='digital-outcomes-and-specialists'),
+        call(2, framework='digital-outcomes-and-specialists'),
+    ])
+    assert mock_data_client.get_supplier.call_count == 2
+    assert mock_data_client.get_supplier_framework_info.call_count == 2
+
+
+def test_supplier_lot_handler_only_makes_rows_from_submitted_services_in_its_lot():
+    handler = SupplierLotHandler('digital-outcomes', 'outcomes.csv',
+                                 lambda record: [('services', [service['id'] for service in record['services']])])
+
+    assert list(handler.create_rows(_record(1, True, [
+        _draft('digital-outcomes', id=1), _draft('digital-outcomes', 'not-submitted', id=2),
+        _draft('digital-specialists', id=3),
+    ]))) == [[('services', [1])]]
+    assert list(handler.create_rows(_record(2, True, [_draft('digital-specialists', id=4)]))) == []
+
+
+def test_labs_handler_makes_a_row_for_each_submitted_lab_from_suppliers_on_the_framework():
+    handler = LabsHandler('labs.csv')
+    services = [
+        _draft('user-research-studios', id=1, links={}), _draft('user-research-studios', 'not-submitted', id=2),
+        _draft('digital-outcomes', id=3),
+    ]
+
+    assert list(handler.create_rows(_record(1, True, services))) == [make_labs_row(services[0])]
+    assert list(handler.create_rows(_record(2, False, services))) == []
+    assert make_labs_row(services[0]) == [
+        ('id', 1), ('lot', 'user-research-studios'), ('lotSlug', 'user-research-studios'), ('status', 'submitted')
+    ]
+
+
+def test_lot_csv_writer_routes_each_record_to_every_lot_file(tmpdir):
+    handlers = [
+        SupplierLotHandler('digital-outcomes', str(tmpdir.join('outcomes.csv')),
+                           lambda record: [('supplier_id', record['supplier_id'])]),
+        LabsHandler(str(tmpdir.join('labs.csv'))),
+    ]
+
+    with LotCSVWriter(handlers) as writer:
+        writer.write_record(_record(1, True, [_draft('digital-outcomes', id=1)]))
+        writer.write_record(_record(2, True, [_draft('user-research-studios', id=2)]))
+        writer.write_record(_record(3, True, [_draft('digital-outcomes', id=3), _draft('user-research-studios', id=4)]))
+
+    assert tmpdir.join('outcomes.csv').read().splitlines() == ['supplier_id', '1', '3']
+    assert tmpdir.join('labs.csv').read().splitlines() == [
+        'id,lot,lotSlug,status',
+        '2,user-research-studios,user-research-studios,submitted',
+        '4,user-research-studios,user-research-studios,submitted',
+    ]
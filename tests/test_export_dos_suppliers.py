@@ -246,76 +246,55 @@ def test_add_draft_counts(mock_data_client):
     }
 
 
-def test_get_declaration_questions():
-    q1, q2, q3 = Mock(id='found1'), Mock(id='not_found'), Mock(id='found2')
+def _declaration_content(*numbers):
+    return [Mock(questions=[Mock(id='q{}'.format(number), number=number) for number in numbers])]
 
-    questions1 = [q1, q2]
-    questions2 = [q3]
-    sections = [Mock(questions=questions1), Mock(questions=questions2)]
-    record = {'declaration': {'found1': 'value1', 'found2': 'value2', 'extra': 'value3'}}
 
-    answers = list(export_dos_suppliers.get_declaration_questions(sections, record))
+def test_add_failed_questions():
+    answers = dict(
+        [(i, True) for i in chain(range(1, 14), range(15, 17), range(38, 55))] +
+        [(i, False) for i in chain(range(17, 21), range(21, 37))] +
+        [(14, CORRECT_DECLARATION_RESPONSES[14][0])]
+    )
 
-    assert answers == [
-        (q1, 'value1'),
-        (q2, None),
-        (q3, 'value2'),
-    ]
+    failed_questions_adder = export_dos_suppliers.add_failed_questions(_declaration_content(*sorted(answers)))
 
+    declaration = dict(('q{}'.format(number), answer) for number, answer in answers.items())
+    record = failed_questions_adder({'declaration': dict(declaration, status='complete')})
 
-@patch('dmscripts.export_dos_suppliers.get_declaration_questions')
-def test_add_failed_questions(get_declaration_questions):
-    get_declaration_questions.return_value = [
-        (Mock(number=i), True) for i in chain(range(1, 14), range(15, 17), range(38, 55))
-    ] + [
-        (Mock(number=i), False) for i in chain(range(17, 21), range(21, 37))
-    ] + [
-        (Mock(number=14), CORRECT_DECLARATION_RESPONSES[14][0])
-    ]
+    assert record['failed_mandatory'] == []
+    assert len(record['discretionary']) == 16
 
-    failed_questions_adder = export_dos_suppliers.add_failed_questions(None)
 
-    record = failed_questions_adder({'declaration': {'status': 'complete'}})
+def test_add_failed_questions_keeps_manifest_order():
+    failed_questions_adder = export_dos_suppliers.add_failed_questions(_declaration_content(22, 2, 34, 1, 55))
 
-    assert record['failed_mandatory'] == []
-    assert len(record['discretionary']) == 16
+    record = failed_questions_adder({'declaration': {'status': 'complete', 'q22': True, 'q34': 'Mitigation'}})
 
+    assert record['failed_mandatory'] == ['Q2', 'Q1']
+    assert record['discretionary'] == [('Q22', True), ('Q34', 'Mitigation')]
 
-@patch('dmscripts.export_dos_suppliers.get_declaration_questions')
-def test_add_failed_question_mandatory_false_is_true(get_declaration_questions):
-    get_declaration_questions.return_value = [
-        (Mock(number=1), False)
-    ]
 
-    failed_questions_adder = export_dos_suppliers.add_failed_questions(None)
+def test_add_failed_question_mandatory_false_is_true():
+    failed_questions_adder = export_dos_suppliers.add_failed_questions(_declaration_content(1))
 
-    record = failed_questions_adder({'declaration': {'status': 'complete'}})
+    record = failed_questions_adder({'declaration': {'status': 'complete', 'q1': False}})
 
     assert record['failed_mandatory'] == ['Q1']
 
 
-@patch('dmscripts.export_dos_suppliers.get_declaration_questions')
-def test_add_failed_question_mandatory_true_is_false(get_declaration_questions):
-    get_declaration_questions.return_value = [
-        (Mock(number=17), True)
-    ]
-
-    failed_questions_adder = export_dos_suppliers.add_failed_questions(None)
+def test_add_failed_question_mandatory_true_is_false():
+    failed_questions_adder = export_dos_suppliers.add_failed_questions(_declaration_content(17))
 
-    record = failed_questions_adder({'declaration': {'status': 'complete'}})
+    record = failed_questions_adder({'declaration': {'status': 'complete', 'q17': True}})
 
     assert record['failed_mandatory'] == ['Q17']
 
 
-@patch('dmscripts.export_dos_suppliers.get_declaration_questions')
-def test_add_failed_question_mandatory_liability_insurance(get_declaration_questions):
-    get_declaration_questions.return_value = [
-        (Mock(number=14), "Invalid")
-    ]
-
-    failed_questions_adder = export_dos_suppliers.add_failed_questions(None)
+def test_add_failed_question_mandatory_liability_insurance():
+    failed_questions_adder = export_dos_suppliers.add_failed_questions(_declaration_content(14))
 
-    record = failed_questions_adder({'declaration': {'status': 'complete'}})
+    record = failed_questions_adder({'declaration': {'status': 'complete', 'q14': "Invalid"}})
 
     assert record['failed_mandatory'] == ['Q14']
 
@@ -1,11 +1,10 @@
 import pytest
 import mock
 
-from dmapiclient import HTTPError
-
 from dmscripts.generate_framework_agreement_data import (
     make_filename_key,
-    read_csv, supplier_is_on_framework)
+    read_csv, build_framework_agreements, index_lot_counts, lot_counts_for_supplier_id,
+    check_lots_csv, read_validated_csv, lots_row_errors, declaration_row_errors)
 
 
 @pytest.fixture
@@ -33,15 +32,123 @@ def test_make_filename_key():
     assert make_filename_key('kev@the*agency', 1234) == 'kevtheagency-1234'
 
 
-def test_supplier_is_on_framework(mock_data_client):
-    mock_data_client.get_supplier_framework_info.return_value = {'frameworkInterest': {'onFramework': True}}
-    assert supplier_is_on_framework(mock_data_client, 123) is True
+def _declaration(supplier_id):
+    row = [''] * 59
+    row[0] = supplier_id
+    row[18:22] = ['Contact', 'contact@example.com', 'Supplier {}'.format(supplier_id), 'Address']
+    row[26:28] = ['uk', '12345678']
+    return row
+
+
+def _lots(supplier_id):
+    return [supplier_id, 'Supplier', '', '1', '', '0', '', '2', '', '0', '']
+
+
+def test_build_framework_agreements_looks_up_all_suppliers_at_once(mock_data_client, tmpdir):
+    mock_data_client.find_framework_suppliers.return_value = {'supplierFrameworks': [
+        {'supplierId': 1, 'onFramework': True},
+        {'supplierId': 2, 'onFramework': False},
+        {'supplierId': 3, 'onFramework': None},
+        {'supplierId': 5, 'onFramework': True},
+    ]}
+
+    build_framework_agreements(
+        mock_data_client,
+        [_declaration(supplier_id) for supplier_id in ['1', '2', '3', '4', '5']],
+        [_lots(supplier_id) for supplier_id in ['1', '2', '3', '4']],
+        str(tmpdir)
+    )
+
+    mock_data_client.find_framework_suppliers.assert_called_once_with('g-cloud-7')
+    assert not mock_data_client.get_supplier_framework_info.called
+
+    passed = tmpdir.join('g7-framework-data.tsv').read().splitlines()
+    assert [line.split('\t')[1] for line in passed[1:]] == ['1']
+    assert passed[1].split('\t')[8:] == [
+        'Lot 1: Infrastructure as a Service (IaaS)', '', 'Lot 3: Software as a Service (SaaS)', '',
+        'Pass', 'No bid', 'Pass', 'No bid',
+    ]
+
+    failed = tmpdir.join('g7-fail-data.tsv').read().splitlines()
+    assert [line.split('\t')[1] for line in failed[1:]] == ['2', '4']
+
+    no_lots = tmpdir.join('g7-no-lots-data.tsv').read().splitlines()
+    assert no_lots[1:] == ['Supplier_5-5\t5\tSupplier 5']
+
+
+def test_index_lot_counts():
+    lot_counts = index_lot_counts([_lots('1'), _lots('2')])
+
+    assert lot_counts_for_supplier_id(lot_counts, '2') == _lots('2')
+    assert lot_counts_for_supplier_id(lot_counts, '3') is None
+
+
+def test_index_lot_counts_rejects_duplicate_supplier_ids():
+    with pytest.raises(ValueError) as e:
+        index_lot_counts([_lots('1'), _lots('2'), _lots('1')])
+
+    assert str(e.value) == "Duplicate supplier IDs in lots: 1"
+
+
+def test_check_lots_csv_rejects_duplicate_supplier_ids():
+    assert check_lots_csv([_lots('1'), _lots('2')]) == (True, "Lots file OK")
+    assert check_lots_csv([_lots('1'), _lots('1')]) == (False, "Duplicate supplier ID 1")
+
+
+def _write_csv(path, rows):
+    path.write('\n'.join(','.join(row) for row in rows) + '\n')
+    return str(path)
+
+
+def test_read_validated_csv_skips_invalid_rows_and_collects_every_error(tmpdir):
+    lots_file = _write_csv(tmpdir.join('lots.csv'), [
+        ['Digital Marketplace ID'] + [''] * 10,
+        _lots('1'),
+        ['2', 'Too short'],
+        _lots('3')[:3] + [''] + _lots('3')[4:],
+        _lots('1'),
+        _lots('4'),
+    ])
+    errors = []
+
+    rows = read_validated_csv(lots_file, lots_row_errors(), errors)
+
+    assert [row[0] for row in rows] == ['1', '4']
+    assert errors == [
+        (3, "Row incorrect length"),
+        (4, "Row missing required field 3"),
+        (5, "Duplicate supplier ID 1"),
+    ]
+
+
+def test_declaration_row_errors():
+    incomplete = _declaration('1')
+    incomplete[3] = 'complete'
+    incomplete[19] = incomplete[27] = ''
+
+    assert declaration_row_errors(_declaration('1')) == []
+    assert declaration_row_errors(['1']) == ["Row incorrect length"]
+    assert declaration_row_errors(incomplete) == [
+        "Row missing required field 19", "Row missing required field 27"
+    ]
+
 
-    mock_data_client.get_supplier_framework_info.return_value = {'frameworkInterest': {'onFramework': False}}
-    assert supplier_is_on_framework(mock_data_client, 123) is False
+def test_build_framework_agreements_from_validated_csv_files(mock_data_client, tmpdir):
+    mock_data_client.find_framework_suppliers.return_value = {'supplierFrameworks': [
+        {'supplierId': 1, 'onFramework': True},
+        {'supplierId': 2, 'onFramework': True},
+    ]}
+    lots_file = _write_csv(tmpdir.join('lots.csv'), [_lots('1'), _lots('2')])
+    declaration_file = _write_csv(tmpdir.join('declarations.csv'), [_declaration('1'), ['2']])
+    errors = []
 
-    mock_data_client.get_supplier_framework_info.return_value = {'frameworkInterest': {'onFramework': None}}
-    assert supplier_is_on_framework(mock_data_client, 123) is None
+    build_framework_agreements(
+        mock_data_client,
+        read_validated_csv(declaration_file, declaration_row_errors, errors),
+        read_validated_csv(lots_file, lots_row_errors(), errors),
+        str(tmpdir.join('output'))
+    )
 
-    mock_data_client.get_supplier_framework_info.side_effect = HTTPError()
-    assert supplier_is_on_framework(mock_data_client, 123) is False
+    passed = tmpdir.join('output', 'g7-framework-data.tsv').read().splitlines()
+    assert [line.split('\t')[1] for line in passed[1:]] == ['1']
+    assert errors == [(2, "Row incorrect length")]
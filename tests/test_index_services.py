@@ -0,0 +1,718 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import pytest
+import mock
+import requests
+
+from dmapiclient import APIError, HTTPError
+
+from dmscripts.index_services import (
+    SearchAPIClient, batched, ServiceIndexer, BulkServiceIndexer, make_indexer, index_services,
+    load_watermark, save_watermark, changed_since, WatermarkTracker, do_index, cap_watermark,
+    request_service_pages, Checkpointer, make_index_name, prefetch_pages, ConcurrencyController, percentile,
+    merge_join, find_differences, service_keys, do_reconcile, make_shards, do_sharded_index
+)
+
+
+@pytest.fixture
+def search_client(request):
+    patch = mock.patch('dmscripts.index_services.SearchAPIClient')
+    request.addfinalizer(patch.stop)
+    return patch.start().return_value
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 2)) == []
+
+
+def test_search_api_client_sends_requests_through_session():
+    session = mock.Mock()
+    session.request.return_value.json.return_value = {'results': []}
+    client = SearchAPIClient('http://search-api', 'token', session=session)
+
+    assert client.bulk([{'action': 'delete', 'id': 1}], index='g-cloud') == {'results': []}
+    session.request.assert_called_once_with(
+        'POST', 'http://search-api/g-cloud/services/bulk',
+        headers=mock.ANY, data=mock.ANY, params=None
+    )
+    assert json.loads(session.request.call_args[1]['data']) == {'operations': [{'action': 'delete', 'id': 1}]}
+    assert session.request.call_args[1]['headers']['Authorization'] == 'Bearer token'
+
+
+def test_search_api_client_raises_http_error_from_session():
+    session = mock.Mock()
+    session.request.return_value.raise_for_status.side_effect = requests.HTTPError(response=mock.Mock())
+    client = SearchAPIClient('http://search-api', 'token', session=session)
+
+    with pytest.raises(HTTPError):
+        client.bulk([], index='g-cloud')
+
+
+def test_service_indexer_reuses_client_within_a_thread():
+    indexer = ServiceIndexer('http://search-api', 'token', 'g-cloud')
+    clients = []
+    thread = threading.Thread(target=lambda: clients.append(indexer.get_client()))
+    thread.start()
+    thread.join()
+
+    assert indexer.get_client() is indexer.get_client()
+    assert indexer.get_client() is not clients[0]
+    assert indexer.get_client().session is clients[0].session
+
+
+def test_service_indexer_indexes_published_and_deletes_others(search_client):
+    indexer = ServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'disabled'}]
+
+    assert indexer(services) == [(services[0], True), (services[1], True)]
+    search_client.index.assert_called_once_with(1, services[0], index='g-cloud')
+    search_client.delete.assert_called_once_with(2, index='g-cloud')
+
+
+def test_service_indexer_reports_failed_services(search_client):
+    search_client.index.side_effect = [APIError(), None]
+    indexer = ServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}]
+
+    assert indexer(services) == [(services[0], False), (services[1], True)]
+
+
+def test_bulk_service_indexer_sends_one_request_per_batch(search_client):
+    search_client.bulk.return_value = {'results': [{'id': 1, 'status': 200}, {'id': 2, 'status': 200}]}
+    indexer = BulkServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'enabled'}]
+
+    assert indexer(services) == [(services[0], True), (services[1], True)]
+    search_client.bulk.assert_called_once_with([
+        {'action': 'index', 'id': 1, 'service': services[0]},
+        {'action': 'delete', 'id': 2},
+    ], index='g-cloud')
+
+
+def test_bulk_service_indexer_reports_per_item_errors(search_client):
+    search_client.bulk.return_value = {'results': [
+        {'id': 1, 'status': 400, 'error': 'mapping error'}, {'id': 2, 'status': 200}
+    ]}
+    indexer = BulkServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}]
+
+    assert indexer(services) == [(services[0], False), (services[1], True)]
+
+
+def test_bulk_service_indexer_fails_services_missing_from_response(search_client):
+    search_client.bulk.return_value = {'results': [{'id': '2', 'status': 200}]}
+    indexer = BulkServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': '1', 'status': 'published'}, {'id': '2', 'status': 'published'}]
+
+    assert indexer(services) == [(services[0], False), (services[1], True)]
+
+
+def test_bulk_service_indexer_fails_whole_batch_on_request_error(search_client):
+    search_client.bulk.side_effect = APIError()
+    indexer = BulkServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}, {'id': 2, 'status': 'published'}]
+
+    assert indexer(services) == [(services[0], False), (services[1], False)]
+
+
+@mock.patch('dmscripts.index_services.make_session')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_keeps_a_connection_open_for_each_worker(request_service_pages, make_session, search_client):
+    request_service_pages.return_value = []
+
+    do_index('http://search-api', 'token', 'http://api', 'token', False, 'g-cloud', None, min_workers=10,
+             max_workers=30)
+    make_session.assert_called_once_with(30)
+
+    make_session.reset_mock()
+    do_index('http://search-api', 'token', 'http://api', 'token', False, 'g-cloud', None, max_workers=30,
+             pool_size=40)
+    make_session.assert_called_once_with(40)
+
+
+def test_make_indexer():
+    assert type(make_indexer('http://search-api', 'token', 'g-cloud')) is ServiceIndexer
+    assert type(make_indexer('http://search-api', 'token', 'g-cloud', batch_size=50)) is BulkServiceIndexer
+
+
+@pytest.mark.parametrize('serial', [True, False])
+def test_index_services_groups_services_into_batches(serial):
+    indexer = mock.Mock(side_effect=lambda batch: [(service, service['id'] != 3) for service in batch])
+    services = [{'id': i} for i in range(5)]
+
+    assert index_services(indexer, services, serial=serial, batch_size=2) is False
+    assert sorted(len(args[0]) for args, kwargs in indexer.call_args_list) == [1, 2, 2]
+
+
+def test_index_services_sends_services_one_at_a_time_by_default():
+    indexer = mock.Mock(side_effect=lambda batch: [(service, True) for service in batch])
+
+    assert index_services(indexer, [{'id': 1}, {'id': 2}], serial=True) is True
+    indexer.assert_has_calls([mock.call([{'id': 1}]), mock.call([{'id': 2}])])
+
+
+def test_load_watermark_returns_none_without_state_file(tmpdir):
+    assert load_watermark(str(tmpdir.join('state.json'))) is None
+
+
+def test_save_and_load_watermark(tmpdir):
+    state_file = str(tmpdir.join('state.json'))
+    save_watermark(state_file, ('2016-01-02T00:00:00.000000Z', '123'))
+
+    assert load_watermark(state_file) == ('2016-01-02T00:00:00.000000Z', '123')
+
+
+def test_changed_since():
+    services = [
+        {'id': '1', 'updatedAt': '2016-01-01T00:00:00.000000Z'},
+        {'id': '2', 'updatedAt': '2016-01-02T00:00:00.000000Z'},
+        {'id': '3', 'updatedAt': '2016-01-02T00:00:00.000000Z'},
+        {'id': '4', 'updatedAt': '2016-01-03T00:00:00.000000Z'},
+    ]
+
+    assert list(changed_since(services, None)) == services
+    assert list(changed_since(services, ('2016-01-02T00:00:00.000000Z', '2'))) == services[2:]
+
+
+def test_watermark_tracker_ignores_failed_services():
+    tracker = WatermarkTracker(None)
+    tracker({'id': '1', 'updatedAt': '2016-01-01T00:00:00.000000Z'}, True)
+    tracker({'id': '2', 'updatedAt': '2016-01-03T00:00:00.000000Z'}, False)
+    tracker({'id': '3', 'updatedAt': '2016-01-02T00:00:00.000000Z'}, True)
+
+    assert tracker.watermark == ('2016-01-02T00:00:00.000000Z', '3')
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_incremental_only_indexes_changed_services(request_service_pages, search_client, tmpdir):
+    state_file = str(tmpdir.join('state.json'))
+    save_watermark(state_file, ('2016-01-02T00:00:00.000000Z', '2'))
+    request_service_pages.return_value = [(1, [
+        {'id': '1', 'status': 'published', 'updatedAt': '2016-01-01T00:00:00.000000Z'},
+        {'id': '2', 'status': 'published', 'updatedAt': '2016-01-02T00:00:00.000000Z'},
+        {'id': '3', 'status': 'disabled', 'updatedAt': '2016-01-03T00:00:00.000000Z'},
+    ])]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    state_file=state_file) is True
+
+    assert not search_client.index.called
+    search_client.delete.assert_called_once_with('3', index='g-cloud')
+    assert load_watermark(state_file) == ('2016-01-03T00:00:00.000000Z', '3')
+
+
+def test_cap_watermark():
+    assert cap_watermark(None, '2016-01-02') is None
+    assert cap_watermark(('2016-01-01', '1'), '2016-01-02') == ('2016-01-01', '1')
+    assert cap_watermark(('2016-01-03', '1'), '2016-01-02') == ('2016-01-02', '')
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_incremental_picks_up_edits_made_during_the_run(request_service_pages, search_client, tmpdir):
+    state_file = str(tmpdir.join('state.json'))
+    edits = {}
+
+    def pages(*args, **kwargs):
+        yield 1, [{'id': '1', 'status': 'published', 'updatedAt': '2016-01-01T00:00:00.000000Z'}]
+        # Service 1 is edited after its page was read, then service 2 after that
+        edits['1'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        time.sleep(0.001)
+        yield 2, [{'id': '2', 'status': 'published',
+                   'updatedAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')}]
+
+    request_service_pages.side_effect = pages
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    state_file=state_file, prefetch=0) is True
+
+    edited = {'id': '1', 'status': 'published', 'updatedAt': edits['1']}
+    assert list(changed_since([edited], load_watermark(state_file))) == [edited]
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_incremental_keeps_watermark_after_failures(request_service_pages, search_client, tmpdir):
+    state_file = str(tmpdir.join('state.json'))
+    search_client.index.side_effect = [None, APIError()]
+    request_service_pages.return_value = [(1, [
+        {'id': '1', 'status': 'published', 'updatedAt': '2016-01-01T00:00:00.000000Z'},
+        {'id': '2', 'status': 'published', 'updatedAt': '2016-01-02T00:00:00.000000Z'},
+    ])]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    state_file=state_file) is False
+
+    assert load_watermark(state_file) is None
+
+
+@mock.patch('dmscripts.index_services.dmapiclient.DataAPIClient')
+def test_request_service_pages_follows_next_links(DataAPIClient):
+    DataAPIClient.return_value.find_services.side_effect = [
+        {'services': [{'id': 1}], 'links': {'next': 'http://api/services?page=3'}},
+        {'services': [{'id': 2}], 'links': {}},
+    ]
+
+    assert list(request_service_pages('http://api', 'token', 'g-cloud-7', start_page=2)) == [
+        (2, [{'id': 1}]), (3, [{'id': 2}])
+    ]
+    DataAPIClient.return_value.find_services.assert_has_calls([
+        mock.call(page=2, framework='g-cloud-7'), mock.call(page=3, framework='g-cloud-7')
+    ])
+
+
+@mock.patch('dmscripts.index_services.dmapiclient.DataAPIClient')
+def test_request_service_pages_steps_through_pages_until_not_found(DataAPIClient):
+    DataAPIClient.return_value.find_services.side_effect = [
+        {'services': [{'id': 1}], 'links': {'next': 'http://api/services?page=3'}},
+        HTTPError(mock.Mock(status_code=404)),
+    ]
+
+    assert list(request_service_pages('http://api', 'token', None, start_page=2, page_step=3)) == [
+        (2, [{'id': 1}])
+    ]
+    DataAPIClient.return_value.find_services.assert_has_calls([
+        mock.call(page=2, framework=None), mock.call(page=5, framework=None)
+    ])
+
+
+def test_checkpointer_moves_to_next_page_once_all_services_are_acknowledged(tmpdir):
+    checkpointer = Checkpointer(str(tmpdir.join('checkpoint.json')))
+    services = checkpointer.track([(1, [{'id': 'a'}, {'id': 'b'}]), (2, [{'id': 'c'}])])
+
+    a, b, c = list(services)
+    checkpointer(a, True)
+    checkpointer(c, True)
+    assert checkpointer.page == 1
+    assert checkpointer.acknowledged == {'a', 'c'}
+
+    checkpointer(b, True)
+    assert checkpointer.page == 3
+    assert checkpointer.acknowledged == set()
+
+
+def test_checkpointer_handles_a_service_on_more_than_one_page(tmpdir):
+    checkpointer = Checkpointer(str(tmpdir.join('checkpoint.json')))
+    services = list(checkpointer.track([(1, [{'id': 'a'}, {'id': 'b'}]), (2, [{'id': 'b'}, {'id': 'c'}])]))
+    assert [service['id'] for service in services] == ['a', 'b', 'b', 'c']
+
+    for service in services:
+        checkpointer(service, True)
+
+    assert checkpointer.page == 3
+    assert checkpointer.acknowledged == set()
+
+
+def test_checkpointer_does_not_acknowledge_failed_services(tmpdir):
+    checkpointer = Checkpointer(str(tmpdir.join('checkpoint.json')))
+    a, b = list(checkpointer.track([(1, [{'id': 'a'}, {'id': 'b'}])]))
+    checkpointer(a, True)
+    checkpointer(b, False)
+    checkpointer.save()
+
+    resumed = Checkpointer.load(str(tmpdir.join('checkpoint.json')))
+    assert resumed.page == 1
+    assert list(resumed.track([(1, [{'id': 'a'}, {'id': 'b'}])])) == [{'id': 'b'}]
+
+
+def test_checkpointer_saves_every_interval_acknowledgements(tmpdir):
+    checkpoint_file = tmpdir.join('checkpoint.json')
+    checkpointer = Checkpointer(str(checkpoint_file), interval=2)
+    a, b, c = list(checkpointer.track([(1, [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}])]))
+
+    checkpointer(a, True)
+    assert not checkpoint_file.check()
+    checkpointer(b, True)
+    assert json.loads(checkpoint_file.read()) == {'page': 1, 'acknowledged': ['a', 'b'], 'inFlight': ['c']}
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_resumes_from_checkpoint(request_service_pages, search_client, tmpdir):
+    checkpoint_file = tmpdir.join('checkpoint.json')
+    checkpoint_file.write(json.dumps({'page': 2, 'acknowledged': ['3'], 'inFlight': ['4']}))
+    request_service_pages.return_value = [
+        (2, [{'id': '3', 'status': 'published'}, {'id': '4', 'status': 'published'}]),
+        (3, [{'id': '5', 'status': 'published'}]),
+    ]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    checkpoint_file=str(checkpoint_file), resume=True) is True
+
+    request_service_pages.assert_called_once_with('http://api', 'token', None,
+                                                  start_page=2, stats=mock.ANY, page_step=1)
+    assert [args[0] for args, kwargs in search_client.index.call_args_list] == ['4', '5']
+    assert not checkpoint_file.check()
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_keeps_checkpoint_after_failures(request_service_pages, search_client, tmpdir):
+    checkpoint_file = tmpdir.join('checkpoint.json')
+    search_client.index.side_effect = [None, APIError()]
+    request_service_pages.return_value = [
+        (1, [{'id': '1', 'status': 'published'}]),
+        (2, [{'id': '2', 'status': 'published'}]),
+    ]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    checkpoint_file=str(checkpoint_file)) is False
+
+    assert json.loads(checkpoint_file.read()) == {'page': 2, 'acknowledged': [], 'inFlight': ['2']}
+
+
+def test_make_index_name():
+    assert make_index_name('g-cloud', datetime(2016, 5, 4, 10, 30, 1)) == 'g-cloud-2016-05-04-10-30-01'
+
+
+@mock.patch('dmscripts.index_services.make_index_name', return_value='g-cloud-new')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_with_alias_builds_new_index_and_switches_alias(request_service_pages, make_index_name,
+                                                                 search_client):
+    search_client.count_documents.return_value = 2
+    request_service_pages.return_value = [
+        (1, [{'id': '1', 'status': 'published'}, {'id': '2', 'status': 'disabled'}]),
+        (2, [{'id': '3', 'status': 'published'}]),
+    ]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    alias='g-cloud') is True
+
+    search_client.create_index.assert_called_once_with('g-cloud-new')
+    assert [args[0] for args, kwargs in search_client.index.call_args_list] == ['1', '3']
+    assert not search_client.delete.called
+    search_client.count_documents.assert_called_once_with('g-cloud-new')
+    search_client.set_alias.assert_called_once_with('g-cloud', 'g-cloud-new')
+
+
+@mock.patch('dmscripts.index_services.time.sleep')
+@mock.patch('dmscripts.index_services.make_index_name', return_value='g-cloud-new')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_with_alias_does_not_switch_alias_if_counts_differ(request_service_pages, make_index_name, sleep,
+                                                                    search_client):
+    search_client.count_documents.return_value = 1
+    request_service_pages.return_value = [
+        (1, [{'id': '1', 'status': 'published'}, {'id': '2', 'status': 'published'}]),
+    ]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    alias='g-cloud') is False
+
+    assert search_client.count_documents.call_count == 5
+    assert not search_client.set_alias.called
+
+
+@mock.patch('dmscripts.index_services.make_index_name', return_value='g-cloud-new')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_with_alias_does_not_switch_alias_after_failures(request_service_pages, make_index_name,
+                                                                  search_client):
+    search_client.index.side_effect = APIError()
+    request_service_pages.return_value = [(1, [{'id': '1', 'status': 'published'}])]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    alias='g-cloud') is False
+
+    assert not search_client.set_alias.called
+
+
+def test_prefetch_pages_yields_pages_in_order():
+    pages = [(1, [{'id': 1}]), (2, [{'id': 2}]), (3, [])]
+
+    assert list(prefetch_pages(iter(pages), 2)) == pages
+
+
+def test_prefetch_pages_raises_fetch_errors_to_consumer():
+    def pages():
+        yield 1, [{'id': 1}]
+        raise APIError()
+
+    prefetched = prefetch_pages(pages(), 2)
+    assert next(prefetched) == (1, [{'id': 1}])
+    with pytest.raises(APIError):
+        next(prefetched)
+
+
+def test_prefetch_pages_limits_buffered_services():
+    fetched = []
+    fourth_page_fetched = threading.Event()
+
+    def pages():
+        for page in range(1, 6):
+            fetched.append(page)
+            if page == 4:
+                fourth_page_fetched.set()
+            yield page, [{'id': page}, {'id': page * 10}]
+
+    prefetched = prefetch_pages(pages(), 10, max_services=4)
+    assert next(prefetched)[0] == 1
+    assert fourth_page_fetched.wait(5)
+
+    # page 1 has been handed over, pages 2 and 3 fill the buffer and page 4 waits for space
+    assert fetched == [1, 2, 3, 4]
+    assert [page for page, services in prefetched] == [2, 3, 4, 5]
+
+
+def _prefetch_thread():
+    return next(thread for thread in threading.enumerate() if thread.name == 'prefetch-pages')
+
+
+@pytest.mark.parametrize('max_services', [None, 2])
+def test_prefetch_pages_stops_producer_when_consumer_stops(max_services):
+    def pages():
+        page = 0
+        while True:
+            page += 1
+            yield page, [{'id': page}, {'id': page * 10}]
+
+    prefetched = prefetch_pages(pages(), 1, max_services=max_services)
+    assert next(prefetched)[0] == 1
+    producer = _prefetch_thread()
+
+    prefetched.close()
+
+    producer.join(5)
+    assert not producer.is_alive()
+
+
+def test_index_services_limits_batches_in_flight():
+    in_flight = []
+    lock = threading.Lock()
+
+    def indexer(batch):
+        with lock:
+            in_flight.append(batch[0]['id'])
+        time.sleep(0.01)
+        return [(service, True) for service in batch]
+
+    def services():
+        for i in range(20):
+            with lock:
+                # number of services read from the source but not yet indexed
+                assert i - len(in_flight) <= 3
+            yield {'id': i}
+
+    assert index_services(indexer, services(), max_in_flight=3) is True
+
+
+def test_percentile():
+    assert percentile([5, 1, 4, 2, 3], 0.95) == 5
+    assert percentile(list(range(1, 101)), 0.95) == 95
+    assert percentile([1], 0.95) == 1
+
+
+def test_concurrency_controller_increases_limit_while_latency_stays_low():
+    controller = ConcurrencyController(2, 12, initial=10, window=2)
+    for i in range(6):
+        controller.acquire()
+        controller.release(0.1, 1, 0)
+
+    assert controller.limit == 12
+
+
+def test_concurrency_controller_halves_limit_when_latency_rises():
+    controller = ConcurrencyController(2, 20, initial=10, window=2)
+    for latency in [0.1, 0.1, 0.5, 0.5]:
+        controller.acquire()
+        controller.release(latency, 1, 0)
+
+    assert controller.limit == 5
+
+
+def test_concurrency_controller_halves_limit_on_errors_down_to_minimum():
+    controller = ConcurrencyController(4, 20, initial=10, window=1)
+    for i in range(3):
+        controller.acquire()
+        controller.release(0.1, 10, 1)
+
+    assert controller.limit == 4
+
+
+def test_concurrency_controller_limits_concurrent_calls():
+    controller = ConcurrencyController(1, 2, initial=2, window=1000)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def indexer(batch):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.pop()
+        return [(service, True) for service in batch]
+
+    assert index_services(indexer, [{'id': i} for i in range(10)], controller=controller) is True
+    assert max(peak) == 2
+
+
+def test_merge_join():
+    assert list(merge_join([(1, 'a'), (3, 'c'), (4, 'd')], [(2, 'B'), (3, 'C'), (5, 'E')])) == [
+        (1, 'a', None), (2, None, 'B'), (3, 'c', 'C'), (4, 'd', None), (5, None, 'E'),
+    ]
+    assert list(merge_join([], [(1, 'A')])) == [(1, None, 'A')]
+    assert list(merge_join([(1, 'a')], [])) == [(1, 'a', None)]
+
+
+def test_service_keys_sorts_by_id_and_keeps_reconcile_fields():
+    assert service_keys([
+        {'id': 2, 'status': 'published', 'updatedAt': 'b', 'serviceName': 'Two'},
+        {'id': '1', 'updatedAt': 'a'},
+    ]) == [
+        ('1', {'status': None, 'updatedAt': 'a'}),
+        ('2', {'status': 'published', 'updatedAt': 'b'}),
+    ]
+
+
+def test_find_differences():
+    data_api_services = [
+        ('1', {'status': 'published', 'updatedAt': '2016-01-01'}),
+        ('2', {'status': 'published', 'updatedAt': '2016-01-02'}),
+        ('3', {'status': 'published', 'updatedAt': '2016-01-02'}),
+        ('4', {'status': 'disabled', 'updatedAt': '2016-01-02'}),
+        ('5', {'status': 'published', 'updatedAt': '2016-01-02'}),
+    ]
+    search_api_documents = [
+        ('1', {'updatedAt': '2016-01-01'}),
+        ('2', {'updatedAt': '2016-01-01'}),
+        ('4', {'updatedAt': '2016-01-01'}),
+        ('5', {'updatedAt': None}),
+        ('6', {'updatedAt': '2016-01-01'}),
+    ]
+
+    assert list(find_differences(data_api_services, search_api_documents)) == [
+        ('stale', '2'), ('missing', '3'), ('orphaned', '4'), ('orphaned', '6'),
+    ]
+
+
+@mock.patch('dmscripts.index_services.dmapiclient.DataAPIClient')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_reconcile_only_sends_differences(request_service_pages, DataAPIClient, search_client):
+    request_service_pages.return_value = [(1, [
+        {'id': '1', 'status': 'published', 'updatedAt': '2016-01-01'},
+        {'id': '2', 'status': 'published', 'updatedAt': '2016-01-02'},
+    ])]
+    search_client.iter_documents.return_value = [
+        {'id': '1', 'updatedAt': '2016-01-01'}, {'id': '3', 'updatedAt': '2016-01-01'},
+    ]
+    DataAPIClient.return_value.get_service.return_value = {'services': {'id': '2', 'status': 'published'}}
+
+    assert do_reconcile('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None) is True
+
+    DataAPIClient.return_value.get_service.assert_called_once_with('2')
+    search_client.index.assert_called_once_with('2', {'id': '2', 'status': 'published'}, index='g-cloud')
+    search_client.delete.assert_called_once_with('3', index='g-cloud')
+
+
+@mock.patch('dmscripts.index_services.dmapiclient.DataAPIClient')
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_reconcile_ignores_documents_from_other_frameworks(request_service_pages, DataAPIClient, search_client):
+    request_service_pages.return_value = [(1, [{'id': '1', 'status': 'published', 'updatedAt': '2016-01-01'}])]
+    search_client.iter_documents.return_value = [
+        {'id': '1', 'updatedAt': '2016-01-01'}, {'id': '3', 'updatedAt': '2016-01-01'},
+    ]
+
+    assert do_reconcile('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', 'g-cloud-7') is True
+
+    assert not search_client.delete.called
+    assert not search_client.index.called
+
+
+def test_search_api_client_records_request_timings():
+    session = mock.Mock()
+    session.request.return_value.json.return_value = {'results': []}
+    client = SearchAPIClient('http://search-api', 'token', session=session)
+    client.bulk([], index='g-cloud')
+
+    assert client.stats.histograms['serialise'].count == 1
+    assert client.stats.histograms['search_api_request'].count == 1
+
+
+@mock.patch('dmscripts.index_services.time.sleep')
+def test_service_indexer_records_retries(sleep, search_client):
+    search_client.index.side_effect = [HTTPError(), None]
+    indexer = ServiceIndexer('http://search-api', 'token', 'g-cloud')
+
+    assert indexer([{'id': 1, 'status': 'published'}]) == [({'id': 1, 'status': 'published'}, True)]
+    assert indexer.stats.counters['retries'] == 1
+    assert indexer.stats.histograms['retry_wait'].count == 1
+
+
+@mock.patch('dmscripts.index_services.time.sleep')
+def test_bulk_service_indexer_does_not_retry_client_errors(sleep, search_client):
+    search_client.bulk.side_effect = HTTPError(mock.Mock(status_code=404))
+    indexer = BulkServiceIndexer('http://search-api', 'token', 'g-cloud')
+    services = [{'id': 1, 'status': 'published'}]
+
+    assert indexer(services) == [(services[0], False)]
+    assert search_client.bulk.call_count == 1
+    assert 'retries' not in indexer.stats.counters
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_writes_stats_file(request_service_pages, search_client, tmpdir):
+    request_service_pages.return_value = [(1, [{'id': '1', 'status': 'published'}, {'id': '2', 'status': 'x'}])]
+    stats_file = tmpdir.join('stats.json')
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    stats_file=str(stats_file)) is True
+
+    summary = json.loads(stats_file.read())
+    assert summary['status'] is True
+    assert summary['index'] == 'g-cloud'
+    assert summary['counters'] == {'services': 2}
+    assert summary['stages']['indexer_call']['count'] == 2
+
+
+def test_checkpointer_steps_between_tracked_pages(tmpdir):
+    checkpointer = Checkpointer(str(tmpdir.join('checkpoint.json')), page=2, page_step=4)
+    services = checkpointer.track([(2, [{'id': 'a'}]), (6, [{'id': 'b'}])])
+
+    for service in services:
+        checkpointer(service, True)
+
+    assert checkpointer.page == 10
+
+
+def test_make_shards_by_framework():
+    assert make_shards('g-cloud-6,g-cloud-7', 'framework', 4) == [
+        ('g-cloud-6', {'frameworks': 'g-cloud-6'}),
+        ('g-cloud-7', {'frameworks': 'g-cloud-7'}),
+    ]
+
+
+def test_make_shards_by_page():
+    assert make_shards(None, 'page', 2) == [
+        ('page-1-of-2', {'frameworks': None, 'shard': (0, 2)}),
+        ('page-2-of-2', {'frameworks': None, 'shard': (1, 2)}),
+    ]
+
+
+@mock.patch('dmscripts.index_services.request_service_pages')
+def test_do_index_shard_starts_from_its_first_page(request_service_pages, search_client):
+    request_service_pages.return_value = [(2, [{'id': '1', 'status': 'published'}])]
+
+    assert do_index('http://search-api', 'token', 'http://api', 'token', True, 'g-cloud', None,
+                    shard=(1, 3), create_index=False) is True
+
+    request_service_pages.assert_called_once_with('http://api', 'token', None, start_page=2, stats=mock.ANY,
+                                                  page_step=3)
+    assert not search_client.create_index.called
+
+
+@mock.patch('dmscripts.index_services.multiprocessing.Pool')
+def test_do_sharded_index_creates_index_once_and_runs_each_shard(Pool, search_client):
+    Pool.return_value.map.return_value = [('g-cloud-6', True), ('g-cloud-7', False)]
+
+    assert do_sharded_index('http://search-api', 'token', 'g-cloud', 'g-cloud-6,g-cloud-7', 'framework',
+                            data_api_url='http://api', data_api_access_token='token', serial=False,
+                            state_file='state.json') is False
+
+    search_client.create_index.assert_called_once_with('g-cloud')
+    Pool.assert_called_once_with(2)
+    shards = Pool.return_value.map.call_args[0][1]
+    assert [(name, arguments['frameworks'], arguments['state_file'], arguments['create_index'])
+            for name, arguments in shards] == [
+        ('g-cloud-6', 'g-cloud-6', 'state.json.g-cloud-6', False),
+        ('g-cloud-7', 'g-cloud-7', 'state.json.g-cloud-7', False),
+    ]
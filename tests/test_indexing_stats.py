@@ -0,0 +1,59 @@
+import json
+
+from dmscripts.indexing_stats import Histogram, IndexingStats
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_histogram_counts_values_into_buckets():
+    histogram = Histogram()
+    for value in [0.0005, 0.002, 0.002, 60]:
+        histogram.add(value)
+
+    summary = histogram.to_dict()
+    assert summary['count'] == 4
+    assert summary['max'] == 60
+    assert summary['buckets']['<=0.001'] == 1
+    assert summary['buckets']['<=0.0025'] == 2
+    assert summary['buckets']['>30'] == 1
+
+
+def test_time_records_stage_duration():
+    clock = FakeClock()
+    stats = IndexingStats(clock=clock)
+
+    with stats.time('search_api_request'):
+        clock.now += 0.5
+
+    assert stats.histograms['search_api_request'].total == 0.5
+
+
+def test_window_rate_only_counts_recent_services():
+    clock = FakeClock()
+    stats = IndexingStats(window=10, clock=clock)
+
+    stats.services_indexed(100)
+    clock.now += 20
+    stats.services_indexed(50)
+    clock.now += 5
+
+    assert stats.window_rate() == 5.0
+    assert stats.summary()['rate'] == 6.0
+
+
+def test_write_summary(tmpdir):
+    stats = IndexingStats()
+    stats.increment('retries')
+    stats.record('retry_wait', 1)
+    stats.write_summary(str(tmpdir.join('stats.json')), status=True)
+
+    summary = json.loads(tmpdir.join('stats.json').read())
+    assert summary['status'] is True
+    assert summary['counters'] == {'retries': 1}
+    assert summary['stages']['retry_wait']['count'] == 1
@@ -4,7 +4,7 @@ import pytest
 
 from collections import OrderedDict
 from dmscripts.insert_dos_framework_results import insert_result, check_service_essentials, get_submitted_drafts, \
-    check_declaration_answers, process_submitted_drafts, process_dos_results
+    check_declaration_answers, process_submitted_drafts, process_dos_results, DeclarationRules
 from mock import mock
 from dmapiclient import HTTPError
 
@@ -342,6 +342,47 @@ def test_check_declaration_answers_fails_for_bad_q14():
     assert check_declaration_answers(declaration_content, declaration) == 'Fail'
 
 
+def test_check_declaration_answers_looks_up_each_question_once():
+    declaration_content = mock.Mock()
+    questions = {'q1': mock.Mock(number=1), 'q17': mock.Mock(number=17), 'q21': mock.Mock(number=21)}
+    declaration_content.get_question.side_effect = questions.get
+    declaration_rules = DeclarationRules(declaration_content)
+    declaration = OrderedDict([("q1", True), ("q17", False), ("q21", True), ("status", "complete")])
+
+    for _ in range(3):
+        assert check_declaration_answers(declaration_content, declaration, declaration_rules) == 'Discretionary'
+
+    assert declaration_content.get_question.call_count == 4
+
+
+def test_check_declaration_answers_skips_fields_not_in_manifest():
+    declaration_content = mock.Mock()
+    declaration_content.get_question.return_value = None
+    declaration = OrderedDict([("notAQuestion", "anything"), ("status", "complete")])
+    assert check_declaration_answers(declaration_content, declaration) == 'Pass'
+
+
+def test_check_declaration_answers_requires_boolean_answers():
+    declaration_content = mock.Mock()
+    declaration_content.get_question.return_value = mock.Mock(number=1)
+    declaration = OrderedDict([("key1", 1), ("status", "complete")])
+    assert check_declaration_answers(declaration_content, declaration) == 'Fail'
+
+
+def test_declaration_rules_questions_are_in_manifest_order():
+    declaration_content = [
+        mock.Mock(questions=[mock.Mock(id='q17', number=17), mock.Mock(id='intro', number=-1)]),
+        mock.Mock(questions=[mock.Mock(id='q14', number=14), mock.Mock(id='q34', number=34)]),
+    ]
+
+    questions = DeclarationRules(declaration_content).questions()
+
+    assert [(question_id, rule.number, rule.kind) for question_id, rule in questions] == [
+        ('q17', 17, 'must-be-false'), ('q14', 14, 'one-of'), ('q34', 34, 'mitigating'),
+    ]
+    assert questions[1][1].allowed[1].startswith("Not applicable")
+
+
 def test_process_submitted_drafts_for_good_services(mock_data_client):
     mock_data_client.find_draft_services.return_value = {
         "services": [COMPLETE_OUTCOMES_DRAFT, COMPLETE_RESEARCH_PARTICIPANTS_DRAFT]
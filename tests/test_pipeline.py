@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from dmscripts.pipeline import Pipeline
+
+
+def test_pipeline_runs_records_through_stages_in_order():
+    def slow_double(number):
+        time.sleep(0.001 * (number % 3))
+        return number * 2
+
+    pipeline = Pipeline().map(slow_double, workers=4).filter(lambda number: number % 3).map(str, workers=2)
+
+    assert list(pipeline.run(range(20))) == [str(number * 2) for number in range(20) if number * 2 % 3]
+
+
+def test_pipeline_limits_concurrency_of_each_stage():
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0}
+
+    def track(record):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(0.005)
+        with lock:
+            running['now'] -= 1
+        return record
+
+    assert list(Pipeline().map(track, workers=3).run(range(20))) == list(range(20))
+    assert running['max'] <= 3
+
+
+def test_pipeline_only_takes_records_as_results_are_consumed():
+    taken = []
+
+    def records():
+        for number in range(100):
+            taken.append(number)
+            yield number
+
+    results = Pipeline().map(lambda record: record, workers=2, max_in_flight=5).run(records())
+
+    assert next(results) == 0
+    assert len(taken) == 5
+    results.close()
+
+
+def test_pipeline_shuts_down_threads_when_finished_failed_or_closed():
+    threads_before = threading.active_count()
+
+    list(Pipeline().map(lambda record: record, workers=5).run(range(10)))
+    assert threading.active_count() == threads_before
+
+    def fail(record):
+        raise ValueError(record)
+
+    with pytest.raises(ValueError):
+        list(Pipeline().map(fail, workers=5).run(range(10)))
+    assert threading.active_count() == threads_before
+
+    results = Pipeline().map(lambda record: record, workers=5).run(range(10))
+    next(results)
+    results.close()
+    assert threading.active_count() == threads_before
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+from dmscripts.export_dos_lots import find_suppliers_with_drafts
+from dmscripts.export_dos_suppliers import add_draft_counts
+from dmscripts.snapshot import SnapshotClient, take_snapshot
+
+FRAMEWORK_SLUG = 'digital-outcomes-and-specialists'
+
+
+@pytest.fixture
+def api_client(mock_data_client):
+    mock_data_client.get_interested_suppliers.return_value = {'interestedSuppliers': [1, 2]}
+    mock_data_client.get_supplier.side_effect = lambda supplier_id: {
+        'suppliers': {'id': supplier_id, 'name': u'Supplier {}'.format(supplier_id)}
+    }
+    mock_data_client.get_supplier_framework_info.side_effect = lambda supplier_id, framework_slug: {
+        'frameworkInterest': {
+            'declaration': {'status': 'complete', 'nameOfOrganisation': u'Org {}'.format(supplier_id)},
+            'onFramework': supplier_id == 1,
+        }
+    }
+    mock_data_client.find_draft_services_iter.side_effect = lambda supplier_id, framework: iter([
+        {'id': supplier_id * 10, 'lot': 'digital-outcomes', 'lotSlug': 'digital-outcomes', 'status': 'submitted'},
+        {'id': supplier_id * 10 + 1, 'lot': 'user-research-studios', 'lotSlug': 'user-research-studios',
+         'status': 'not-submitted'},
+    ])
+    return mock_data_client
+
+
+@pytest.fixture
+def snapshot_file(request, tmpdir, api_client):
+    path = str(tmpdir.join('snapshot.db'))
+    take_snapshot(api_client, FRAMEWORK_SLUG, path, workers=2)
+    return path
+
+
+def snapshot_client(request, path):
+    client = SnapshotClient(path)
+    request.addfinalizer(client.close)
+    return client
+
+
+def test_take_snapshot_returns_supplier_count(tmpdir, api_client):
+    path = str(tmpdir.join('snapshot.db'))
+
+    assert take_snapshot(api_client, FRAMEWORK_SLUG, path) == 2
+    assert os.path.exists(path)
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_take_snapshot_replaces_existing_snapshot(tmpdir, api_client):
+    path = str(tmpdir.join('snapshot.db'))
+    take_snapshot(api_client, FRAMEWORK_SLUG, path)
+
+    api_client.get_interested_suppliers.return_value = {'interestedSuppliers': [2]}
+    take_snapshot(api_client, FRAMEWORK_SLUG, path)
+
+    client = SnapshotClient(path)
+    try:
+        assert client.get_interested_suppliers(FRAMEWORK_SLUG) == {'interestedSuppliers': [2]}
+        with pytest.raises(KeyError):
+            client.get_supplier(1)
+    finally:
+        client.close()
+
+
+def test_take_snapshot_does_not_replace_snapshot_on_error(tmpdir, api_client):
+    path = str(tmpdir.join('snapshot.db'))
+    take_snapshot(api_client, FRAMEWORK_SLUG, path)
+
+    api_client.get_supplier.side_effect = ValueError("API error")
+    with pytest.raises(ValueError):
+        take_snapshot(api_client, FRAMEWORK_SLUG, path)
+
+    client = SnapshotClient(path)
+    try:
+        assert client.get_interested_suppliers(FRAMEWORK_SLUG) == {'interestedSuppliers': [1, 2]}
+    finally:
+        client.close()
+
+
+def test_snapshot_client_answers_like_the_api(request, snapshot_file, api_client):
+    client = snapshot_client(request, snapshot_file)
+
+    assert client.get_interested_suppliers(FRAMEWORK_SLUG) == {'interestedSuppliers': [1, 2]}
+    assert client.get_supplier(2) == {'suppliers': {'id': 2, 'name': 'Supplier 2'}}
+    assert client.get_supplier_framework_info(1, FRAMEWORK_SLUG)['frameworkInterest']['onFramework'] is True
+    assert [draft['id'] for draft in client.find_draft_services(2, framework=FRAMEWORK_SLUG)['services']] == [20, 21]
+    assert [draft['id'] for draft in client.find_draft_services_iter(1, framework=FRAMEWORK_SLUG)] == [10, 11]
+
+
+def test_snapshot_client_raises_key_error_for_missing_records(request, snapshot_file):
+    client = snapshot_client(request, snapshot_file)
+
+    with pytest.raises(KeyError):
+        client.get_supplier(3)
+    with pytest.raises(KeyError):
+        client.get_supplier_framework_info(1, 'g-cloud-7')
+    with pytest.raises(KeyError):
+        client.find_draft_services(1, framework='g-cloud-7')
+
+
+def test_snapshot_client_requires_an_existing_file(tmpdir):
+    with pytest.raises(IOError):
+        SnapshotClient(str(tmpdir.join('missing.db')))
+
+
+def test_exports_run_from_snapshot_without_api_calls(request, snapshot_file, api_client):
+    api_client.reset_mock()
+    client = snapshot_client(request, snapshot_file)
+
+    records = list(find_suppliers_with_drafts(client, FRAMEWORK_SLUG))
+    records = [add_draft_counts(client, FRAMEWORK_SLUG)(record) for record in records]
+
+    assert [record['supplier']['name'] for record in records] == ['Supplier 1', 'Supplier 2']
+    assert [record['onFramework'] for record in records] == [True, False]
+    assert [record['declaration']['nameOfOrganisation'] for record in records] == ['Org 1', 'Org 2']
+    assert [record['counts']['completed']['digital-outcomes'] for record in records] == [1, 1]
+    assert api_client.method_calls == []